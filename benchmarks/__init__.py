@@ -0,0 +1,9 @@
+"""
+Offline benchmarks for the data pipeline.
+
+synthetic writes TLC-shaped trip parquet files, NOAA-shaped weather CSVs and
+a taxi zone shapefile; run times every pipeline stage against them and
+writes the timings as JSON:
+
+    python -m benchmarks.run --rows-per-month 200000 --months 2023-01 2023-02
+"""
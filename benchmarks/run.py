@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+import pandas as pd
+
+import cli
+from benchmarks.synthetic import generate_dataset
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Months with data for every part 3 query (Q3 reads 2024-01, Q6 late 2023-09)
+DEFAULT_MONTHS = ["2023-09", "2023-10", "2024-01"]
+DEFAULT_ROWS_PER_MONTH = 100_000
+RESULTS_DIRECTORY = os.path.join(REPOSITORY_ROOT, "benchmarks", "results")
+REGRESSION_TOLERANCE = 0.10  # slowdown reported by compare_results
+
+def load_parts(root: str = REPOSITORY_ROOT) -> dict:
+   r"""
+   Load the definitions of the project parts without running the pipeline.
+
+   Args:
+       root: Directory containing the part files
+
+   Returns:
+       dict: Shared namespace of the parts, registered as the module
+           benchmarks._parts (see cli.load_parts)
+   """
+   return cli.load_parts(len(cli.PART_FILES), root, module_name="benchmarks._parts")
+
+def time_stage(
+    results: list[dict],
+    stage: str,
+    run,
+    repeat: int = 1,
+    setup=None,
+    **details
+):
+   r"""
+   Time a stage and record the result.
+
+   Args:
+       results: List the result is appended to
+       stage: Stage name
+       run: Function without arguments running the stage
+       repeat: Number of timed runs; the fastest is reported
+       setup: Function called before each run, outside the timing
+       **details: Extra fields stored with the result
+
+   Returns:
+       The return value of the last run
+   """
+   seconds = []
+   value = None
+   for _ in range(repeat):
+       if setup is not None:
+           setup()
+       start = time.perf_counter()
+       value = run()
+       seconds.append(time.perf_counter() - start)
+
+   rows = len(value) if isinstance(value, pd.DataFrame) else None
+   results.append({"stage": stage, "seconds": min(seconds), "runs": seconds, "rows": rows, **details})
+   print(f"{stage} {' '.join(f'{k}={v}' for k, v in details.items())}: {min(seconds):.3f}s")
+   return value
+
+def _remove_database(parts: dict) -> None:
+   """Delete the benchmark database so a load starts from an empty file."""
+   # Pooled connections would keep writing to the deleted file
+   parts["engine"].dispose()
+   for suffix in ("", "-wal", "-shm"):
+       if os.path.exists(f"project.db{suffix}"):
+           os.remove(f"project.db{suffix}")
+
+def run_benchmarks(
+    workdir: str,
+    months: list[str] = DEFAULT_MONTHS,
+    rows_per_month: int = DEFAULT_ROWS_PER_MONTH,
+    repeat: int = 1,
+    seed: int = 0
+) -> list[dict]:
+   r"""
+   Generate synthetic data in a directory and time every pipeline stage on it.
+
+   Args:
+       workdir: Empty directory for the data, database and caches
+       months: Months of trip files ("YYYY-MM")
+       rows_per_month: Trips per service and month
+       repeat: Timed runs per stage
+       seed: Seed of the synthetic data
+
+   Returns:
+       list: One result per stage, as recorded by time_stage
+
+   Notes:
+       - Runs with the working directory set to workdir, since the parts use
+         relative paths for the database and caches
+       - Trip cleaning is timed on the usual sample and on the full month;
+         the full months are what gets loaded into the database
+   """
+   dataset = generate_dataset(os.path.join(workdir, "source"), months, rows_per_month, seed)
+   previous_directory = os.getcwd()
+   os.chdir(workdir)
+   try:
+       parts = load_parts()
+       parts["OFFLINE_MODE"] = True
+       parts["TAXI_ZONES_SHAPEFILE"] = dataset["taxi_zones"]
+       parts["WEATHER_CSV_DIR"] = os.path.dirname(dataset["weather"][0])
+
+       results = []
+       time_stage(results, "get_zone_centroid_index", lambda: parts["get_zone_centroid_index"](refresh=True), repeat)
+
+       frames = {"taxi_trips": [], "uber_trips": []}
+       for service, table_name, cleaner in (
+           ("taxi", "taxi_trips", "get_and_clean_taxi_month"),
+           ("uber", "uber_trips", "get_and_clean_uber_month")
+       ):
+           for path in dataset[service]:
+               month = os.path.basename(path)[-15:-8]
+               time_stage(results, cleaner, lambda: parts[cleaner](path), repeat, month=month)
+               frames[table_name].append(time_stage(
+                   results, "clean_trip_month_full",
+                   lambda: parts["clean_trip_month"](path, service, sample=False),
+                   repeat, service=service, month=month
+               ))
+       frames = {table_name: pd.concat(dfs, ignore_index=True) for table_name, dfs in frames.items()}
+
+       hourly_weather, daily_weather = time_stage(
+           results, "load_and_clean_weather_data",
+           lambda: parts["load_and_clean_weather_data"](refresh=True), repeat
+       )
+       frames["hourly_weather"] = hourly_weather
+       frames["daily_weather"] = daily_weather
+       table_rows = {table_name: len(df) for table_name, df in frames.items()}
+
+       for bulk in (False, True):
+           time_stage(
+               results, "write_dataframes_to_table",
+               lambda: parts["write_dataframes_to_table"](frames, bulk=bulk),
+               repeat, setup=partial(_remove_database, parts), bulk=bulk, table_rows=table_rows
+           )
+
+       for name in parts["QUERY_REGISTRY"]:
+           time_stage(
+               results, "query",
+               lambda: parts["run_queries"]([name], workers=1, use_cache=False)[name],
+               repeat, name=name
+           )
+
+       for name, figure in parts["REPORT_FIGURES"].items():
+           time_stage(
+               results, "figure_inputs",
+               lambda: parts["read_figure_inputs"](figure["inputs"], use_cache=False),
+               repeat, name=name
+           )
+
+       def zone_trip_counts() -> pd.DataFrame:
+           conn = parts["connect_read_only"]()
+           try:
+               return parts["query_zone_trip_counts"](conn)
+           finally:
+               conn.close()
+
+       time_stage(results, "figure_inputs", zone_trip_counts, repeat, name="zone_heatmap")
+       return results
+   finally:
+       os.chdir(previous_directory)
+
+def git_commit() -> str | None:
+   """Return the commit the benchmarked code is at, if it is a git checkout."""
+   try:
+       return subprocess.run(
+           ["git", "rev-parse", "HEAD"], cwd=REPOSITORY_ROOT,
+           capture_output=True, text=True, check=True
+       ).stdout.strip()
+   except (OSError, subprocess.CalledProcessError):
+       return None
+
+def compare_results(baseline: dict, current: dict, tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+   r"""
+   Compare the stage timings of two benchmark runs.
+
+   Args:
+       baseline: Benchmark report to compare against
+       current: Benchmark report to check
+       tolerance: Relative slowdown above which a stage is a regression
+
+   Returns:
+       pd.DataFrame: baseline and current seconds, their ratio and a
+           regression flag per stage present in both runs
+   """
+   def stage_seconds(report: dict) -> pd.Series:
+       return pd.Series({
+           " ".join(
+               f"{field}={result[field]}" if field != "stage" else result[field]
+               for field in ("stage", "name", "service", "month", "bulk") if field in result
+           ): result["seconds"]
+           for result in report["results"]
+       })
+
+   comparison = pd.concat(
+       [stage_seconds(baseline).rename("baseline"), stage_seconds(current).rename("current")],
+       axis=1, join="inner"
+   )
+   comparison["ratio"] = comparison["current"] / comparison["baseline"]
+   comparison["regression"] = comparison["ratio"] > 1 + tolerance
+   return comparison
+
+def main(argv: list[str] | None = None) -> dict:
+   parser = argparse.ArgumentParser(description="Time the pipeline stages on synthetic TLC and weather data.")
+   parser.add_argument("--months", nargs="+", default=DEFAULT_MONTHS, help="trip months (YYYY-MM)")
+   parser.add_argument("--rows-per-month", type=int, default=DEFAULT_ROWS_PER_MONTH)
+   parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage; the fastest is reported")
+   parser.add_argument("--seed", type=int, default=0)
+   parser.add_argument("--workdir", help="keep the data here instead of a temporary directory")
+   parser.add_argument("--output", help="JSON report path (default benchmarks/results/<time>.json)")
+   parser.add_argument("--compare", help="earlier JSON report to compare the timings with")
+   args = parser.parse_args(argv)
+
+   started_at = datetime.now(timezone.utc)
+   workdir = args.workdir or tempfile.mkdtemp(prefix="tlc-benchmark-")
+   os.makedirs(workdir, exist_ok=True)
+   try:
+       results = run_benchmarks(
+           os.path.abspath(workdir), args.months, args.rows_per_month, args.repeat, args.seed
+       )
+   finally:
+       if args.workdir is None:
+           shutil.rmtree(workdir, ignore_errors=True)
+
+   report = {
+       "created_at": started_at.isoformat(),
+       "git_commit": git_commit(),
+       "python": platform.python_version(),
+       "platform": platform.platform(),
+       "config": {
+           "months": args.months,
+           "rows_per_month": args.rows_per_month,
+           "repeat": args.repeat,
+           "seed": args.seed
+       },
+       "results": results
+   }
+   output = args.output or os.path.join(
+       RESULTS_DIRECTORY, f"benchmark-{started_at.strftime('%Y%m%dT%H%M%SZ')}.json"
+   )
+   os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+   with open(output, "w") as f:
+       json.dump(report, f, indent=2)
+   print(f"Wrote {output}")
+
+   if args.compare:
+       with open(args.compare) as f:
+           comparison = compare_results(json.load(f), report)
+       print(comparison.to_string())
+       regressions = comparison.index[comparison["regression"]].tolist()
+       if regressions:
+           print(f"Slower than {args.compare} by more than {REGRESSION_TOLERANCE:.0%}: {regressions}")
+   return report
+
+if __name__ == "__main__":
+   main()
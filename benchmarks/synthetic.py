@@ -0,0 +1,271 @@
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Bounds of the synthetic zone grid (lat, lon) and the LocationIDs placed on
+# the airports, matching the real taxi zones
+ZONE_GRID_BOX = ((40.56, -74.20), (40.90, -73.72))
+ZONE_COUNT = 263
+AIRPORT_ZONES = {
+    1: ("Newark Airport", "EWR", (40.6895, -74.1745)),
+    132: ("JFK Airport", "Queens", (40.6413, -73.7781)),
+    138: ("LaGuardia Airport", "Queens", (40.7769, -73.8740))
+}
+TAXI_ZONES_CRS = 2263  # NY State Plane (ft), the CRS of the TLC shapefile
+
+WEATHER_CODES = [
+    '-RA:02 |RA |RA', 'BR:1 ||', '-SN:03 |SN |', '+RA:02 |RA |RA', 'UP:09 ||',
+    'HZ:7 ||HZ', 'SN:03 FG:2 |FG SN |', 'RA:02 BR:1 |RA |RA'
+]
+
+def write_taxi_zones(directory: str, seed: int = 0) -> str:
+   r"""
+   Write a taxi zone shapefile with one square polygon per LocationID.
+
+   Args:
+       directory: Directory the shapefile is written to
+       seed: Seed for the zone boroughs
+
+   Returns:
+       str: Path of taxi_zones.shp
+
+   Notes:
+       - Zones 1 to ZONE_COUNT tile ZONE_GRID_BOX; the airport zones are
+         small squares on the airports so airport tagging finds trips
+       - Written in TAXI_ZONES_CRS with the columns of the TLC file
+   """
+   rng = np.random.default_rng(seed)
+   (lat_min, lon_min), (lat_max, lon_max) = ZONE_GRID_BOX
+   columns = int(np.ceil(np.sqrt(ZONE_COUNT)))
+   rows = int(np.ceil(ZONE_COUNT / columns))
+   cell_lat = (lat_max - lat_min) / rows
+   cell_lon = (lon_max - lon_min) / columns
+
+   location_ids = np.arange(1, ZONE_COUNT + 1)
+   row, col = np.divmod(location_ids - 1, columns)
+   polygons = shapely.box(
+       lon_min + col * cell_lon, lat_min + row * cell_lat,
+       lon_min + (col + 1) * cell_lon, lat_min + (row + 1) * cell_lat
+   )
+   zone_names = np.array([f"Zone {i}" for i in location_ids], dtype=object)
+   boroughs = rng.choice(['Manhattan', 'Brooklyn', 'Queens', 'Bronx', 'Staten Island'], ZONE_COUNT)
+   for location_id, (name, borough, (lat, lon)) in AIRPORT_ZONES.items():
+       polygons[location_id - 1] = shapely.box(lon - 0.005, lat - 0.005, lon + 0.005, lat + 0.005)
+       zone_names[location_id - 1] = name
+       boroughs[location_id - 1] = borough
+
+   zones = gpd.GeoDataFrame({
+       'OBJECTID': location_ids,
+       'Shape_Leng': shapely.length(polygons),
+       'Shape_Area': shapely.area(polygons),
+       'zone': zone_names,
+       'LocationID': location_ids,
+       'borough': boroughs
+   }, geometry=polygons, crs=4326).to_crs(TAXI_ZONES_CRS)
+
+   os.makedirs(directory, exist_ok=True)
+   path = os.path.join(directory, "taxi_zones.shp")
+   zones.to_file(path)
+   return path
+
+def _month_datetimes(rng: np.random.Generator, year: int, month: int, rows: int) -> tuple[pd.Series, pd.Series]:
+   """Random pickup and dropoff times in a month, a few starting the hour before it."""
+   start = pd.Timestamp(year=year, month=month, day=1)
+   seconds_in_month = int((start + pd.offsets.MonthBegin(1) - start).total_seconds())
+   pickup = start + pd.to_timedelta(rng.integers(-3600, seconds_in_month, rows), unit='s')
+   dropoff = pickup + pd.to_timedelta(rng.integers(60, 3600, rows), unit='s')
+   return pickup.astype('datetime64[us]'), dropoff.astype('datetime64[us]')
+
+def write_taxi_month(
+    path: str,
+    year: int,
+    month: int,
+    rows: int,
+    seed: int = 0,
+    row_group_size: int = 100_000
+) -> str:
+   r"""
+   Write a month of yellow taxi trips with the TLC parquet schema.
+
+   Args:
+       path: File to write; name it yellow_tripdata_YYYY-MM.parquet
+       year, month: Month the pickups fall in
+       rows: Number of trips
+       seed: Random seed
+       row_group_size: Rows per parquet row group
+
+   Returns:
+       str: path
+   """
+   rng = np.random.default_rng(seed)
+   pickup, dropoff = _month_datetimes(rng, year, month, rows)
+   rate_code = rng.choice([1.0, 2.0, 3.0, 5.0, np.nan], rows, p=[0.86, 0.06, 0.02, 0.01, 0.05])
+   fare = rng.gamma(2, 8, rows).round(2)
+   trips = pd.DataFrame({
+       'VendorID': rng.integers(1, 3, rows).astype('int32'),
+       'tpep_pickup_datetime': pickup,
+       'tpep_dropoff_datetime': dropoff,
+       'passenger_count': rng.choice([1.0, 2.0, 3.0, np.nan], rows, p=[0.7, 0.15, 0.1, 0.05]),
+       'trip_distance': rng.gamma(2, 1.5, rows).round(2),
+       'RatecodeID': rate_code,
+       'store_and_fwd_flag': rng.choice(['N', 'Y'], rows, p=[0.99, 0.01]),
+       'PULocationID': rng.integers(1, ZONE_COUNT + 1, rows).astype('int32'),
+       'DOLocationID': rng.integers(1, ZONE_COUNT + 1, rows).astype('int32'),
+       'payment_type': rng.integers(1, 5, rows),
+       'fare_amount': fare,
+       'extra': rng.choice([0.0, 1.0, 2.5], rows),
+       'mta_tax': 0.5,
+       'tip_amount': rng.gamma(1, 3, rows).round(2),
+       'tolls_amount': rng.choice([0.0, 6.94], rows, p=[0.9, 0.1]),
+       'improvement_surcharge': 1.0,
+       'total_amount': (fare * 1.3).round(2),
+       'congestion_surcharge': rng.choice([0.0, 2.5, np.nan], rows, p=[0.2, 0.75, 0.05]),
+       'Airport_fee': rng.choice([0.0, 1.75, np.nan], rows, p=[0.85, 0.1, 0.05])
+   })
+   # Some files leave total_amount empty
+   trips.loc[rng.random(rows) < 0.01, 'total_amount'] = np.nan
+   trips.to_parquet(path, row_group_size=row_group_size)
+   return path
+
+def write_uber_month(
+    path: str,
+    year: int,
+    month: int,
+    rows: int,
+    seed: int = 0,
+    row_group_size: int = 100_000
+) -> str:
+   r"""
+   Write a month of high volume FHV trips with the TLC parquet schema.
+
+   Args:
+       path: File to write; name it fhvhv_tripdata_YYYY-MM.parquet
+       year, month: Month the pickups fall in
+       rows: Number of trips
+       seed: Random seed
+       row_group_size: Rows per parquet row group
+
+   Returns:
+       str: path
+   """
+   rng = np.random.default_rng(seed)
+   pickup, dropoff = _month_datetimes(rng, year, month, rows)
+   trips = pd.DataFrame({
+       'hvfhs_license_num': rng.choice(['HV0003', 'HV0005'], rows, p=[0.72, 0.28]),
+       'dispatching_base_num': rng.choice(['B03404', 'B03406'], rows),
+       'originating_base_num': rng.choice(['B03404', 'B03406', None], rows),
+       'request_datetime': pickup - pd.to_timedelta(rng.integers(30, 600, rows), unit='s'),
+       'on_scene_datetime': pickup - pd.to_timedelta(rng.integers(0, 120, rows), unit='s'),
+       'pickup_datetime': pickup,
+       'dropoff_datetime': dropoff,
+       'PULocationID': rng.integers(1, ZONE_COUNT + 1, rows).astype('int32'),
+       'DOLocationID': rng.integers(1, ZONE_COUNT + 1, rows).astype('int32'),
+       'trip_miles': rng.gamma(2, 2, rows).round(3),
+       'trip_time': (dropoff - pickup).total_seconds().astype('int64'),
+       'base_passenger_fare': rng.gamma(2, 10, rows).round(2),
+       'tolls': rng.choice([0.0, 6.94], rows, p=[0.92, 0.08]),
+       'bcf': 0.5,
+       'sales_tax': 1.8,
+       'congestion_surcharge': rng.choice([0.0, 2.75], rows, p=[0.3, 0.7]),
+       'airport_fee': rng.choice([0.0, 2.5, np.nan], rows, p=[0.9, 0.05, 0.05]),
+       'tips': rng.choice([0.0, 1.0, 2.0, 5.0], rows, p=[0.8, 0.08, 0.08, 0.04]),
+       'driver_pay': rng.gamma(2, 8, rows).round(2),
+       'shared_request_flag': 'N',
+       'shared_match_flag': 'N',
+       'access_a_ride_flag': ' ',
+       'wav_request_flag': 'N',
+       'wav_match_flag': 'N'
+   })
+   trips.to_parquet(path, row_group_size=row_group_size)
+   return path
+
+def write_weather_csv(path: str, year: int, seed: int = 0) -> str:
+   r"""
+   Write a year of NOAA LCD-style hourly weather observations.
+
+   Args:
+       path: File to write; name it YYYY_weather.csv
+       year: Year of the observations
+       seed: Random seed
+
+   Returns:
+       str: path
+
+   Notes:
+       - One routine observation at :51 past every hour, plus extra
+         observations in about a fifth of the hours, as in the real files
+       - Precipitation has trace ("T") and empty values and temperatures
+         have suspect ("s") flags
+   """
+   rng = np.random.default_rng(seed)
+   routine = pd.date_range(f"{year}-01-01", f"{year}-12-31 23:00", freq='h') + pd.Timedelta(minutes=51)
+   extra = routine[rng.random(len(routine)) < 0.2] - pd.Timedelta(minutes=20)
+   dates = routine.append(extra).sort_values()
+   n = len(dates)
+
+   weather_types = np.array(WEATHER_CODES + [None], dtype=object)[rng.integers(0, len(WEATHER_CODES) + 1, n)]
+   precipitation = np.where(
+       rng.random(n) < 0.6, '0.00',
+       np.where(rng.random(n) < 0.3, 'T', np.round(rng.random(n) / 3, 2).astype(str))
+   ).astype(object)
+   precipitation[rng.random(n) < 0.1] = None
+   temperature = rng.integers(10, 95, n).astype(str).astype(object)
+   suspect = rng.random(n) < 0.02
+   temperature[suspect] = temperature[suspect] + 's'
+
+   pd.DataFrame({
+       'STATION': '72505394728',
+       'DATE': dates.strftime('%Y-%m-%dT%H:%M:%S'),
+       'REPORT_TYPE': np.where(dates.minute == 51, 'FM-15', 'FM-16'),
+       'SOURCE': '7',
+       'HourlyDryBulbTemperature': temperature,
+       'HourlyPrecipitation': precipitation,
+       'HourlyPresentWeatherType': weather_types,
+       'HourlyWindSpeed': rng.integers(0, 25, n)
+   }).to_csv(path, index=False)
+   return path
+
+def generate_dataset(
+    directory: str,
+    months: list[str],
+    rows_per_month: int,
+    seed: int = 0
+) -> dict:
+   r"""
+   Write a complete synthetic data set for the pipeline.
+
+   Args:
+       directory: Directory the files are written to
+       months: Months of trip files ("YYYY-MM")
+       rows_per_month: Trips per service and month
+       seed: Base random seed; every file gets its own seed from it
+
+   Returns:
+       dict: Paths of the files with keys "taxi", "uber" (one per month),
+           "weather" (one per year of the months) and "taxi_zones"
+   """
+   trips_directory = os.path.join(directory, "trips")
+   weather_directory = os.path.join(directory, "weather")
+   os.makedirs(trips_directory, exist_ok=True)
+   os.makedirs(weather_directory, exist_ok=True)
+
+   dataset = {"taxi": [], "uber": [], "weather": []}
+   for i, month in enumerate(months):
+       year, month_number = (int(part) for part in month.split("-"))
+       dataset["taxi"].append(write_taxi_month(
+           os.path.join(trips_directory, f"yellow_tripdata_{month}.parquet"),
+           year, month_number, rows_per_month, seed + 2 * i
+       ))
+       dataset["uber"].append(write_uber_month(
+           os.path.join(trips_directory, f"fhvhv_tripdata_{month}.parquet"),
+           year, month_number, rows_per_month, seed + 2 * i + 1
+       ))
+   for year in sorted({int(month[:4]) for month in months}):
+       dataset["weather"].append(write_weather_csv(
+           os.path.join(weather_directory, f"{year}_weather.csv"), year, seed + year
+       ))
+   dataset["taxi_zones"] = write_taxi_zones(os.path.join(directory, "taxi_zones"), seed)
+   return dataset
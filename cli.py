@@ -0,0 +1,137 @@
+"""
+Command-line entry point for the pipeline.
+
+    python cli.py ingest [--workers N] [--no-refresh] [--offline]
+    python cli.py load [--workers N] [--bulk]
+    python cli.py query [NAME ...] [--no-cache] [--show]
+    python cli.py render [NAME ...] [--force] [--heatmap [--start-month YYYY-MM] [--end-month YYYY-MM]]
+
+--trip-backend parquet stores and queries trips in the partitioned Parquet
+trip store instead of the SQLite trip tables (ingest, load and query).
+
+Each subcommand runs only the parts it needs, and the parts import geopandas,
+shapely, requests and the plotting libraries only where they are used, so a
+query job loads neither the cleaning nor the plotting dependencies.
+"""
+import argparse
+import os
+import sys
+import types
+
+REPOSITORY_ROOT = os.path.dirname(os.path.abspath(__file__))
+PART_FILES = [
+    "part1: download and data cleaning. py",
+    "part2: add dataframe.py",
+    "part3: query.py",
+    "part4: visualization.py"
+]
+# Number of parts, in notebook order, each subcommand runs
+SUBCOMMAND_PARTS = {"ingest": 2, "load": 2, "query": 3, "render": 4}
+
+def load_parts(count: int = len(PART_FILES), root: str = REPOSITORY_ROOT, module_name: str = "tlc_parts") -> dict:
+   r"""
+   Run the first parts in one shared namespace, as the notebook does.
+
+   Args:
+       count: Number of parts to run
+       root: Directory containing the part files
+       module_name: Module the namespace is registered as
+
+   Returns:
+       dict: Shared namespace of the parts
+
+   Notes:
+       - Only definitions run: the notebook's own work (downloading,
+         plotting, running the queries) is under __name__ == "__main__"
+       - The namespace is registered in sys.modules so the pipeline's
+         process pools can pickle its functions
+   """
+   module = types.ModuleType(module_name)
+   sys.modules[module_name] = module
+   for part_file in PART_FILES[:count]:
+       path = os.path.join(root, part_file)
+       with open(path) as f:
+           exec(compile(f.read(), path, "exec"), module.__dict__)
+   return module.__dict__
+
+def ingest(parts: dict, args: argparse.Namespace) -> None:
+   summary = parts["ingest_all_sources"](args.workers, refresh=args.refresh)
+   for table_name, files in summary.items():
+       print(f"{table_name}: " + ", ".join(f"{len(names)} {status}" for status, names in files.items()))
+
+def load(parts: dict, args: argparse.Namespace) -> None:
+   table_to_df_dict = parts["clean_all_sources"](args.workers)
+   if parts["TRIP_BACKEND"] == "parquet":
+       trips = {table_name: table_to_df_dict.pop(table_name) for table_name in parts["TRIP_TABLES"]}
+       for table_name, rows in parts["write_trip_store"](trips).items():
+           print(f"Wrote {rows} rows of {table_name} to {parts['TRIP_STORE_DIRECTORY']}")
+   parts["write_dataframes_to_table"](table_to_df_dict, bulk=args.bulk)
+
+def query(parts: dict, args: argparse.Namespace) -> None:
+   results = parts["run_queries"](args.names or None, args.workers, use_cache=not args.no_cache)
+   for name, result in results.items():
+       print(f"{name}: {len(result)} rows -> {parts['QUERY_REGISTRY'][name]['output']}")
+       if args.show:
+           print(result.to_string(index=False))
+
+def render(parts: dict, args: argparse.Namespace) -> None:
+   summary = parts["render_report"](args.names or None, workers=args.workers, force=args.force)
+   print(", ".join(f"{len(names)} {status}" for status, names in summary.items()))
+   if args.heatmap:
+       print(f"Wrote {parts['save_zone_heatmap'](start_month=args.start_month, end_month=args.end_month)}")
+
+def main(argv: list[str] | None = None) -> None:
+   parser = argparse.ArgumentParser(description="Ingest, load, query and plot the TLC trip and weather data.")
+   parser.add_argument("--offline", action="store_true", help="use cached source files only (TLC_OFFLINE=1)")
+   parser.add_argument("--no-trace", action="store_true", help="do not record stage timings (TLC_TRACE=0)")
+   parser.add_argument(
+       "--trip-backend", choices=["sqlite", "parquet"],
+       help="where trips are stored and queried (TLC_TRIP_BACKEND, default sqlite)"
+   )
+   subparsers = parser.add_subparsers(dest="command", required=True)
+
+   ingest_parser = subparsers.add_parser("ingest", help="load new or changed source files into the database")
+   ingest_parser.add_argument("--workers", type=int, default=1, help="processes cleaning trip months")
+   ingest_parser.add_argument(
+       "--refresh", action=argparse.BooleanOptionalAction, default=True,
+       help="scrape the TLC page for new monthly files (default); --no-refresh uses the manifest's URLs"
+   )
+   ingest_parser.set_defaults(run=ingest)
+
+   load_parser = subparsers.add_parser("load", help="clean every source file and append it to the database")
+   load_parser.add_argument("--workers", type=int, default=1, help="processes cleaning trip months")
+   load_parser.add_argument("--bulk", action="store_true", help="use the bulk loader")
+   load_parser.set_defaults(run=load)
+
+   query_parser = subparsers.add_parser("query", help="run registered queries and write their CSV files")
+   query_parser.add_argument("names", nargs="*", help="queries to run (default all)")
+   query_parser.add_argument("--workers", type=int, default=4, help="queries run at the same time")
+   query_parser.add_argument("--no-cache", action="store_true", help="ignore cached results")
+   query_parser.add_argument("--show", action="store_true", help="print the results")
+   query_parser.set_defaults(run=query)
+
+   render_parser = subparsers.add_parser("render", help="draw the report figures")
+   render_parser.add_argument("names", nargs="*", help="figures to draw (default all)")
+   render_parser.add_argument("--workers", type=int, default=4, help="processes drawing figures")
+   render_parser.add_argument("--force", action="store_true", help="redraw figures whose inputs did not change")
+   render_parser.add_argument("--heatmap", action="store_true", help="also write the zone heat map HTML")
+   render_parser.add_argument("--start-month", help="first pickup month of the heat map, YYYY-MM (default first loaded)")
+   render_parser.add_argument("--end-month", help="last pickup month of the heat map, YYYY-MM (default last loaded)")
+   render_parser.set_defaults(run=render)
+
+   args = parser.parse_args(argv)
+   if args.offline:
+       os.environ["TLC_OFFLINE"] = "1"
+   if args.no_trace:
+       os.environ["TLC_TRACE"] = "0"
+   if args.trip_backend:
+       os.environ["TLC_TRIP_BACKEND"] = args.trip_backend
+   if args.command == "render":
+       # Draw to files; there is no display to show figures on
+       os.environ.setdefault("MPLBACKEND", "Agg")
+
+   parts = load_parts(SUBCOMMAND_PARTS[args.command])
+   args.run(parts, args)
+
+if __name__ == "__main__":
+   main()
@@ -1,12 +1,3 @@
-taxi_data['pickup_coords'] = taxi_data['pickup_coords'].apply(lambda x: f"{x[0]},{x[1]}")
-taxi_data['dropoff_coords'] = taxi_data['dropoff_coords'].apply(lambda x: f"{x[0]},{x[1]}")
-
-uber_data['pickup_coords'] = uber_data['pickup_coords'].apply(lambda x: f"{x[0]},{x[1]}")
-uber_data['dropoff_coords'] = uber_data['dropoff_coords'].apply(lambda x: f"{x[0]},{x[1]}")
-# def str_to_coords(coord_str):
-    #lat, lon = map(float, coord_str.split(','))
-    #return (lat, lon)
-
 engine = db.create_engine(DATABASE_URL)
 
 HOURLY_WEATHER_SCHEMA = """
@@ -46,10 +37,13 @@ CREATE TABLE IF NOT EXISTS taxi_trips (
    total_amount FLOAT,
    congestion_surcharge FLOAT,
    airport_fee FLOAT,
-   pickup_coords VARCHAR(50),
-   dropoff_coords VARCHAR(50),
+   pickup_location_id INTEGER,
+   dropoff_location_id INTEGER,
    weekday_num INTEGER NOT NULL,
-   airport VARCHAR(50)
+   airport VARCHAR(50),
+   pickup_date DATE,
+   pickup_hour INTEGER,
+   pickup_month VARCHAR(7)
 );
 """
 
@@ -66,33 +60,937 @@ CREATE TABLE IF NOT EXISTS uber_trips (
    airport_fee FLOAT,
    driver_pay FLOAT,
    bcf FLOAT,
-   pickup_coords VARCHAR(50),
-   dropoff_coords VARCHAR(50),
+   pickup_location_id INTEGER,
+   dropoff_location_id INTEGER,
    weekday_num INTEGER NOT NULL,
    total_amount FLOAT,
-   airport VARCHAR(50)
+   airport VARCHAR(50),
+   tips FLOAT,
+   pickup_date DATE,
+   pickup_hour INTEGER,
+   pickup_month VARCHAR(7)
+);
+"""
+
+# Zone dimension: trips store integer LocationIDs and join here for coordinates
+TAXI_ZONES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS taxi_zones (
+   location_id INTEGER PRIMARY KEY,
+   latitude FLOAT NOT NULL,
+   longitude FLOAT NOT NULL
+);
+"""
+
+# Hourly ride counts and fare component sums per service, maintained as trips
+# are appended; daily and monthly figures are sums over these rows. weekday_num
+# is part of the key because it follows the dropoff time, so trips picked up
+# in the same hour can fall on two weekdays
+TRIP_ROLLUPS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trip_rollups (
+   service VARCHAR(10) NOT NULL,
+   pickup_date DATE NOT NULL,
+   pickup_hour INTEGER NOT NULL,
+   pickup_month VARCHAR(7) NOT NULL,
+   weekday_num INTEGER NOT NULL,
+   trips INTEGER NOT NULL,
+   base_fares FLOAT,
+   tolls FLOAT,
+   surcharges_and_taxes FLOAT,
+   PRIMARY KEY (service, pickup_date, pickup_hour, weekday_num)
+);
+"""
+
+# Trip counts per service, pickup month and taxi zone, for each end of the
+# trip (trip_end is 'pickup' or 'dropoff'); heatmaps are drawn from these
+# weighted zones instead of from every trip
+ZONE_ROLLUPS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS zone_rollups (
+   service VARCHAR(10) NOT NULL,
+   pickup_month VARCHAR(7) NOT NULL,
+   trip_end VARCHAR(7) NOT NULL,
+   location_id INTEGER NOT NULL,
+   trips INTEGER NOT NULL,
+   PRIMARY KEY (service, pickup_month, trip_end, location_id)
+);
+"""
+
+# Quantile sketch of trip distances per service and pickup month (see
+# build_quantile_sketch), kept in step with the trip tables
+DISTANCE_SKETCHES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS distance_sketches (
+   service VARCHAR(10) NOT NULL,
+   pickup_month VARCHAR(7) NOT NULL,
+   trips INTEGER NOT NULL,
+   sketch TEXT NOT NULL,
+   PRIMARY KEY (service, pickup_month)
+);
+"""
+
+# Count, mean and sum of squared deviations (M2) of trip distances per
+# service and pickup month (see merge_moments), kept in step with the trip tables
+DISTANCE_MOMENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS distance_moments (
+   service VARCHAR(10) NOT NULL,
+   pickup_month VARCHAR(7) NOT NULL,
+   trips INTEGER NOT NULL,
+   mean_distance FLOAT NOT NULL,
+   m2_distance FLOAT NOT NULL,
+   PRIMARY KEY (service, pickup_month)
 );
 """
 
+# One row per source file loaded into a table. period is the month
+# ("YYYY-MM") of a TLC trip file or the year ("YYYY") of a weather file; the
+# file owns every row of the table in that period, so a changed file replaces
+# them and an unchanged one is skipped
+INGESTION_LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingestion_ledger (
+   table_name VARCHAR(50) NOT NULL,
+   source_file VARCHAR(255) NOT NULL,
+   period VARCHAR(7) NOT NULL,
+   sha256 CHAR(64) NOT NULL,
+   rows INTEGER NOT NULL,
+   ingested_at TIMESTAMP NOT NULL,
+   PRIMARY KEY (table_name, source_file)
+);
+"""
+RECORD_INGESTION_SQL = """
+INSERT OR REPLACE INTO ingestion_ledger
+(table_name, source_file, period, sha256, rows, ingested_at)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# Key/value settings of the database. data_version is bumped in the same
+# transaction as every load, so cached query results can tell when the data
+# they were computed from has changed
+DATABASE_META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS database_meta (
+   key VARCHAR(50) PRIMARY KEY,
+   value INTEGER NOT NULL
+);
+"""
+BUMP_DATA_VERSION_SQL = """
+INSERT INTO database_meta (key, value) VALUES ('data_version', 1)
+ON CONFLICT (key) DO UPDATE SET value = value + 1
+"""
+
+# Indexes are created after each bulk load rather than maintained row by row
+TABLE_INDEXES = {
+    "hourly_weather": {
+        "idx_hourly_weather_date": "CREATE INDEX IF NOT EXISTS idx_hourly_weather_date ON hourly_weather (date)"
+    },
+    "daily_weather": {
+        "idx_daily_weather_date": "CREATE INDEX IF NOT EXISTS idx_daily_weather_date ON daily_weather (date)"
+    },
+    # Covering indexes for the date-range, hourly, daily and weekday counts in part 3
+    "taxi_trips": {
+        "idx_taxi_trips_pickup_datetime": "CREATE INDEX IF NOT EXISTS idx_taxi_trips_pickup_datetime ON taxi_trips (pickup_datetime, pickup_date, pickup_hour, weekday_num)",
+        "idx_taxi_trips_pickup_date": "CREATE INDEX IF NOT EXISTS idx_taxi_trips_pickup_date ON taxi_trips (pickup_date)"
+    },
+    "uber_trips": {
+        "idx_uber_trips_pickup_datetime": "CREATE INDEX IF NOT EXISTS idx_uber_trips_pickup_datetime ON uber_trips (pickup_datetime, pickup_date, pickup_hour, weekday_num)",
+        "idx_uber_trips_pickup_date": "CREATE INDEX IF NOT EXISTS idx_uber_trips_pickup_date ON uber_trips (pickup_date)"
+    }
+}
+
+# Columns derived from pickup_datetime when trips are loaded, with their SQL
+# type and the equivalent SQL expression (used to backfill older databases)
+DERIVED_TRIP_COLUMNS = {
+    "pickup_date": ("DATE", "DATE(pickup_datetime)"),
+    "pickup_hour": ("INTEGER", "CAST(strftime('%H', pickup_datetime) AS INTEGER)"),
+    "pickup_month": ("VARCHAR(7)", "strftime('%Y-%m', pickup_datetime)")
+}
+
+# LocationID columns that replaced the "lat,lon" pickup_coords/dropoff_coords
+# strings, and the string column each is recovered from in older databases
+LOCATION_ID_COLUMNS = {
+    "pickup_location_id": "pickup_coords",
+    "dropoff_location_id": "dropoff_coords"
+}
+# Largest distance, in degrees (about 100 m), between a stored coordinate
+# string and the zone centroid it is matched to; centroids are kilometres apart
+LOCATION_ID_MATCH_DEGREES = 0.001
+TRIP_TABLES = ["taxi_trips", "uber_trips"]
+TRIP_TABLE_SCHEMAS = {"taxi_trips": TAXI_TRIPS_SCHEMA, "uber_trips": UBER_TRIPS_SCHEMA}
+
+# Connection settings for bulk loads: write-ahead log, fsync only at WAL
+# checkpoints (a crash can lose the last commit but not corrupt the database),
+# 256 MB page cache and in-memory temp storage. journal_mode is stored in the
+# database file, so write_dataframes_to_table restores it after the load
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY"
+]
+BULK_LOAD_CHUNK_SIZE = 100_000
+
+# Date column each table's ingestion periods are matched on
+PERIOD_DATE_COLUMNS = {
+    "taxi_trips": "pickup_date",
+    "uber_trips": "pickup_date",
+    "hourly_weather": "date",
+    "daily_weather": "date"
+}
+
+# Service name and SQL aggregate for each trip_rollups measure, per trip table
+TRIP_ROLLUP_SOURCES = {
+    "taxi_trips": {
+        "service": "taxi",
+        "measures": {
+            "trips": "COUNT(*)",
+            "base_fares": """SUM(total_amount - (COALESCE(tolls_amount, 0) +
+                                 COALESCE(mta_tax, 0) +
+                                 COALESCE(improvement_surcharge, 0) +
+                                 COALESCE(congestion_surcharge, 0) +
+                                 COALESCE(airport_fee, 0)))""",
+            "tolls": "SUM(COALESCE(tolls_amount, 0))",
+            "surcharges_and_taxes": """SUM(COALESCE(mta_tax, 0) +
+                                       COALESCE(improvement_surcharge, 0) +
+                                       COALESCE(congestion_surcharge, 0) +
+                                       COALESCE(airport_fee, 0))"""
+        }
+    },
+    "uber_trips": {
+        "service": "uber",
+        "measures": {
+            "trips": "COUNT(*)",
+            "base_fares": "SUM(base_passenger_fare)",
+            "tolls": "SUM(COALESCE(tolls, 0))",
+            "surcharges_and_taxes": """SUM(COALESCE(sales_tax, 0) +
+                                       COALESCE(congestion_surcharge, 0) +
+                                       COALESCE(airport_fee, 0) +
+                                       COALESCE(bcf, 0))"""
+        }
+    }
+}
+
+# Distance column summarized for each trip table, and the sketches' relative
+# accuracy: every quantile is within 1% of a true distance at that rank
+DISTANCE_COLUMNS = {
+    "taxi_trips": "trip_distance",
+    "uber_trips": "trip_miles"
+}
+DISTANCE_SKETCH_RELATIVE_ACCURACY = 0.01
+
+def write_schema_file(schema_file: str = DATABASE_SCHEMA_FILE) -> None:
+   """Write the required schema.sql file with every table's schema."""
+   with open(schema_file, "w") as f:
+       f.write(HOURLY_WEATHER_SCHEMA)
+       f.write(DAILY_WEATHER_SCHEMA)
+       f.write(TAXI_TRIPS_SCHEMA)
+       f.write(UBER_TRIPS_SCHEMA)
+       f.write(TAXI_ZONES_SCHEMA)
+       f.write(TRIP_ROLLUPS_SCHEMA)
+       f.write(ZONE_ROLLUPS_SCHEMA)
+       f.write(DISTANCE_SKETCHES_SCHEMA)
+       f.write(DISTANCE_MOMENTS_SCHEMA)
+       f.write(INGESTION_LEDGER_SCHEMA)
+       f.write(DATABASE_META_SCHEMA)
+
+# Column mapping for each table
+TABLE_COLUMN_MAPPINGS = {
+    "hourly_weather": {
+        'date': 'date',
+        'hourly weather type': 'hourly_weather_type',
+        'hourly temperature': 'hourly_temperature',
+        'hourly precipitation': 'hourly_precipitation',
+        'hourly windspeed': 'hourly_windspeed',
+        'hour': 'hour',
+        'weekday_num': 'weekday_num',
+        'severe weather': 'severe_weather'
+    },
+    "daily_weather": {
+        'date': 'date',
+        'daily weather type': 'daily_weather_type',
+        'daily temperature': 'avg_temperature',
+        'daily precipitation': 'avg_precipitation',
+        'daily windspeed': 'avg_windspeed'
+    },
+    "taxi_trips": {
+        'pickup_datetime': 'pickup_datetime',
+        'dropoff_datetime': 'dropoff_datetime',
+        'RatecodeID': 'rate_code_id',
+        'trip_distance': 'trip_distance',
+        'extra': 'extra',
+        'mta_tax': 'mta_tax',
+        'tip_amount': 'tip_amount',
+        'tolls_amount': 'tolls_amount',
+        'improvement_surcharge': 'improvement_surcharge',
+        'total_amount': 'total_amount',
+        'congestion_surcharge': 'congestion_surcharge',
+        'Airport_fee': 'airport_fee',
+        'pickup_location_id': 'pickup_location_id',
+        'dropoff_location_id': 'dropoff_location_id',
+        'weekday_num': 'weekday_num',
+        'airport': 'airport'
+    },
+    "uber_trips": {
+        'hvfhs_license_num': 'hvfhs_license_num',
+        'pickup_datetime': 'pickup_datetime',
+        'dropoff_datetime': 'dropoff_datetime',
+        'trip_miles': 'trip_miles',
+        'base_passenger_fare': 'base_passenger_fare',
+        'tolls': 'tolls',
+        'sales_tax': 'sales_tax',
+        'congestion_surcharge': 'congestion_surcharge',
+        'airport_fee': 'airport_fee',
+        'driver_pay': 'driver_pay',
+        'bcf': 'bcf',
+        'pickup_location_id': 'pickup_location_id',
+        'dropoff_location_id': 'dropoff_location_id',
+        'weekday_num': 'weekday_num',
+        'total_amount': 'total_amount',
+        'airport': 'airport',
+        'tips': 'tips'
+    }
+}
+
+def add_derived_trip_columns(df: pd.DataFrame) -> pd.DataFrame:
+   r"""
+   Add the DERIVED_TRIP_COLUMNS to a trip DataFrame before it is written.
+
+   Args:
+       df: Trips with a pickup_datetime column
+
+   Returns:
+       pd.DataFrame: Copy of df with pickup_date ("YYYY-MM-DD"), pickup_hour
+           (0-23) and pickup_month ("YYYY-MM")
+   """
+   pickup_datetime = pd.to_datetime(df['pickup_datetime'])
+   return df.assign(
+       pickup_date=pickup_datetime.dt.strftime('%Y-%m-%d'),
+       pickup_hour=pickup_datetime.dt.hour,
+       pickup_month=pickup_datetime.dt.strftime('%Y-%m')
+   )
+
+def ensure_taxi_zones(conn) -> None:
+   r"""
+   Create taxi_zones and fill it from the zone centroid index.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+   """
+   conn.execute(db.text(TAXI_ZONES_SCHEMA))
+   zone_centroid_index = get_zone_centroid_index()
+   location_ids = np.flatnonzero(~np.isnan(zone_centroid_index).any(axis=1))
+   conn.execute(
+       db.text(
+           "INSERT OR REPLACE INTO taxi_zones (location_id, latitude, longitude) "
+           "VALUES (:location_id, :latitude, :longitude)"
+       ),
+       [
+           {"location_id": int(location_id), "latitude": float(lat), "longitude": float(lon)}
+           for location_id, (lat, lon) in zip(location_ids, zone_centroid_index[location_ids])
+       ]
+   )
+
+def backfill_location_ids(conn, table_name: str, column: str, coords_column: str) -> int:
+   r"""
+   Fill a LocationID column from the "lat,lon" strings of an older trip table.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+       table_name: Trip table
+       column: LocationID column to fill
+       coords_column: Column holding the "lat,lon" strings
+
+   Returns:
+       int: Rows with coordinates that matched no zone and keep a NULL LocationID
+
+   Notes:
+       Each distinct string gets the LocationID of the nearest taxi_zones
+       centroid within LOCATION_ID_MATCH_DEGREES, so strings written from
+       centroids computed with another shapefile or GEOS/pyproj build still
+       match
+   """
+   zones = conn.execute(db.text("SELECT location_id, latitude, longitude FROM taxi_zones")).fetchall()
+   coords = [
+       row[0] for row in conn.execute(db.text(
+           f'SELECT DISTINCT {coords_column} FROM "{table_name}" WHERE {coords_column} IS NOT NULL'
+       ))
+   ]
+   matches = []
+   if zones and coords:
+       zone_ids, zone_lats, zone_lons = (np.array(values) for values in zip(*zones))
+       lat_lon = pd.Series(coords).str.split(",", n=1, expand=True).reindex(columns=[0, 1])
+       lat_lon = lat_lon.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+       distances = np.hypot(lat_lon[:, [0]] - zone_lats, lat_lon[:, [1]] - zone_lons)
+       nearest = np.nan_to_num(distances, nan=np.inf).argmin(axis=1)
+       # Unparseable strings have NaN distances and match nothing
+       matched = distances[np.arange(len(coords)), nearest] <= LOCATION_ID_MATCH_DEGREES
+       matches = [
+           {"coords": coords[i], "location_id": int(zone_ids[nearest[i]])}
+           for i in np.flatnonzero(matched)
+       ]
+
+   conn.execute(db.text("CREATE TEMP TABLE location_id_matches (coords TEXT PRIMARY KEY, location_id INTEGER)"))
+   try:
+       if matches:
+           conn.execute(db.text("INSERT INTO location_id_matches VALUES (:coords, :location_id)"), matches)
+       conn.execute(db.text(
+           f'UPDATE "{table_name}" SET {column} = (SELECT location_id FROM location_id_matches '
+           f'WHERE location_id_matches.coords = "{table_name}".{coords_column})'
+       ))
+   finally:
+       conn.execute(db.text("DROP TABLE location_id_matches"))
+
+   unmapped = conn.execute(db.text(
+       f'SELECT COUNT(*) FROM "{table_name}" WHERE {coords_column} IS NOT NULL AND {column} IS NULL'
+   )).scalar()
+   if unmapped:
+       print(
+           f"{unmapped} rows of {table_name} have a {coords_column} more than "
+           f"{LOCATION_ID_MATCH_DEGREES} degrees from every taxi zone; their {column} is NULL"
+       )
+   return unmapped
+
+def ensure_trip_columns(conn) -> None:
+   r"""
+   Add and backfill trip columns introduced after a database was created.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+
+   Notes:
+       - Covers DERIVED_TRIP_COLUMNS and LOCATION_ID_COLUMNS; taxi_zones must
+         be filled first so LocationIDs can be recovered from coordinates
+         (see backfill_location_ids)
+   """
+   for table_name in TRIP_TABLES:
+       existing_columns = {
+           row[1] for row in conn.execute(db.text(f'PRAGMA table_info("{table_name}")'))
+       }
+       for column, (column_type, expression) in DERIVED_TRIP_COLUMNS.items():
+           if column not in existing_columns:
+               conn.execute(db.text(f'ALTER TABLE "{table_name}" ADD COLUMN {column} {column_type}'))
+               conn.execute(db.text(f'UPDATE "{table_name}" SET {column} = {expression}'))
+       for column, coords_column in LOCATION_ID_COLUMNS.items():
+           if column not in existing_columns:
+               conn.execute(db.text(f'ALTER TABLE "{table_name}" ADD COLUMN {column} INTEGER'))
+               backfill_location_ids(conn, table_name, column, coords_column)
+
+def trip_rollup_upsert_sql(table_name: str, after_rowid: int = 0) -> str:
+   r"""
+   Build the statement that adds a trip table's rows to trip_rollups.
+
+   Args:
+       table_name: Trip table in TRIP_ROLLUP_SOURCES
+       after_rowid: Only rows with a larger rowid are added, so a freshly
+           appended batch can be rolled up on its own
+
+   Returns:
+       str: INSERT ... ON CONFLICT statement that creates missing hours and
+           adds to the counts and sums of existing ones
+   """
+   source = TRIP_ROLLUP_SOURCES[table_name]
+   measures = source["measures"]
+   # SUM of no non-null values is NULL, so a NULL on either side keeps the other
+   updates = ",\n       ".join(
+       f"{name} = CASE WHEN excluded.{name} IS NULL THEN {name} "
+       f"ELSE COALESCE({name}, 0) + excluded.{name} END"
+       for name in measures
+   )
+   measure_columns = ", ".join(measures)
+   measure_expressions = ",\n       ".join(measures.values())
+   service = source["service"]
+   return f"""
+   INSERT INTO trip_rollups (
+       service, pickup_date, pickup_hour, pickup_month, weekday_num, {measure_columns}
+   )
+   SELECT
+       '{service}', pickup_date, pickup_hour, pickup_month, weekday_num,
+       {measure_expressions}
+   FROM "{table_name}"
+   WHERE rowid > {int(after_rowid)}
+   GROUP BY pickup_date, pickup_hour, pickup_month, weekday_num
+   ON CONFLICT (service, pickup_date, pickup_hour, weekday_num) DO UPDATE SET
+       {updates}
+   """
+
+def rebuild_trip_rollups(conn) -> None:
+   r"""
+   Recompute trip_rollups from every row of the trip tables.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+
+   Notes:
+       - Only needed when trips were changed outside write_dataframes_to_table
+         or when trip_rollups is added to an existing database
+   """
+   conn.execute(db.text("DELETE FROM trip_rollups"))
+   for table_name in TRIP_ROLLUP_SOURCES:
+       conn.execute(db.text(trip_rollup_upsert_sql(table_name)))
+   conn.execute(db.text(BUMP_DATA_VERSION_SQL))
+
+def ensure_trip_rollups(conn) -> None:
+   r"""
+   Create trip_rollups, filling it from existing trips if it is new.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+   """
+   exists = conn.execute(db.text(
+       "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trip_rollups'"
+   )).first()
+   conn.execute(db.text(TRIP_ROLLUPS_SCHEMA))
+   if not exists:
+       rebuild_trip_rollups(conn)
+
+def zone_rollup_upsert_sql(table_name: str, after_rowid: int = 0) -> str:
+   r"""
+   Build the statement that adds a trip table's rows to zone_rollups.
+
+   Args:
+       table_name: Trip table in TRIP_ROLLUP_SOURCES
+       after_rowid: Only rows with a larger rowid are added
+
+   Returns:
+       str: INSERT ... ON CONFLICT statement counting trips per pickup zone
+           and per dropoff zone
+   """
+   service = TRIP_ROLLUP_SOURCES[table_name]["service"]
+   return f"""
+   INSERT INTO zone_rollups (service, pickup_month, trip_end, location_id, trips)
+   SELECT '{service}', pickup_month, 'pickup', pickup_location_id, COUNT(*)
+   FROM "{table_name}"
+   WHERE rowid > {int(after_rowid)} AND pickup_location_id IS NOT NULL
+   GROUP BY pickup_month, pickup_location_id
+   UNION ALL
+   SELECT '{service}', pickup_month, 'dropoff', dropoff_location_id, COUNT(*)
+   FROM "{table_name}"
+   WHERE rowid > {int(after_rowid)} AND dropoff_location_id IS NOT NULL
+   GROUP BY pickup_month, dropoff_location_id
+   ON CONFLICT (service, pickup_month, trip_end, location_id) DO UPDATE SET
+       trips = trips + excluded.trips
+   """
+
+def rebuild_zone_rollups(conn) -> None:
+   r"""
+   Recompute zone_rollups from every row of the trip tables.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+   """
+   conn.execute(db.text("DELETE FROM zone_rollups"))
+   for table_name in TRIP_ROLLUP_SOURCES:
+       conn.execute(db.text(zone_rollup_upsert_sql(table_name)))
+   conn.execute(db.text(BUMP_DATA_VERSION_SQL))
+
+def ensure_zone_rollups(conn) -> None:
+   r"""
+   Create zone_rollups, filling it from existing trips if it is new.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+   """
+   exists = conn.execute(db.text(
+       "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'zone_rollups'"
+   )).first()
+   conn.execute(db.text(ZONE_ROLLUPS_SCHEMA))
+   if not exists:
+       rebuild_zone_rollups(conn)
+
+# Distance sketches
+
+def build_quantile_sketch(
+    values,
+    relative_accuracy: float = DISTANCE_SKETCH_RELATIVE_ACCURACY
+) -> dict:
+   r"""
+   Summarize values in a mergeable quantile sketch with relative error bounds.
+
+   Args:
+       values: Numbers to summarize; NaNs are ignored
+       relative_accuracy: Largest relative error of any quantile
+
+   Returns:
+       dict: Sketch with keys relative_accuracy, count, zero_count and the
+           bucket counts "positive" and "negative" ({bucket index: count})
+
+   Notes:
+       - Logarithmic buckets as in DDSketch: a value x > 0 goes to bucket
+         ceil(log(x) / log(gamma)) with gamma = (1 + a) / (1 - a), so every
+         value in a bucket is within a of the bucket's representative value
+       - Sketches with the same relative_accuracy merge exactly by adding
+         bucket counts (see merge_quantile_sketches)
+       - The number of buckets grows with log(max / min), not with the
+         number of values
+   """
+   values = np.asarray(values, dtype=float)
+   values = values[~np.isnan(values)]
+   log_gamma = np.log((1 + relative_accuracy) / (1 - relative_accuracy))
+
+   def bucket_counts(magnitudes: np.ndarray) -> dict[int, int]:
+       indexes, counts = np.unique(
+           np.ceil(np.log(magnitudes) / log_gamma).astype(np.int64), return_counts=True
+       )
+       return dict(zip(indexes.tolist(), counts.tolist()))
+
+   return {
+       "relative_accuracy": relative_accuracy,
+       "count": int(len(values)),
+       "zero_count": int((values == 0).sum()),
+       "positive": bucket_counts(values[values > 0]),
+       "negative": bucket_counts(-values[values < 0])
+   }
+
+def merge_quantile_sketches(sketches: list[dict]) -> dict:
+   r"""
+   Combine quantile sketches into one sketch of all their values.
+
+   Args:
+       sketches: Sketches from build_quantile_sketch with the same relative
+           accuracy
+
+   Returns:
+       dict: Merged sketch; an empty sketch if sketches is empty
+
+   Raises:
+       ValueError: If the sketches have different relative accuracies
+   """
+   accuracies = {sketch["relative_accuracy"] for sketch in sketches}
+   if len(accuracies) > 1:
+       raise ValueError(f"Cannot merge sketches with relative accuracies {sorted(accuracies)}")
+
+   merged = build_quantile_sketch([], accuracies.pop() if accuracies else DISTANCE_SKETCH_RELATIVE_ACCURACY)
+   for sketch in sketches:
+       merged["count"] += sketch["count"]
+       merged["zero_count"] += sketch["zero_count"]
+       for store in ("positive", "negative"):
+           for index, count in sketch[store].items():
+               merged[store][index] = merged[store].get(index, 0) + count
+   return merged
+
+def sketch_quantile(sketch: dict, q: float) -> float:
+   r"""
+   Estimate a quantile from a sketch.
+
+   Args:
+       sketch: Sketch from build_quantile_sketch or merge_quantile_sketches
+       q: Quantile between 0 and 1
+
+   Returns:
+       float: Value within the sketch's relative accuracy of the value at
+           0-based rank ceil(q * (count - 1)) in sorted order; NaN if the
+           sketch is empty
+   """
+   if sketch["count"] == 0:
+       return float("nan")
+   gamma = (1 + sketch["relative_accuracy"]) / (1 - sketch["relative_accuracy"])
+   target_rank = int(np.ceil(q * (sketch["count"] - 1)))
+
+   def representative(index: int) -> float:
+       return 2 * gamma ** index / (gamma + 1)
+
+   # Bucket values from the most negative to the largest positive one
+   ordered_buckets = [
+       (-representative(index), count)
+       for index, count in sorted(sketch["negative"].items(), reverse=True)
+   ]
+   ordered_buckets.append((0.0, sketch["zero_count"]))
+   ordered_buckets += [
+       (representative(index), count) for index, count in sorted(sketch["positive"].items())
+   ]
+
+   seen = 0
+   for value, count in ordered_buckets:
+       seen += count
+       if seen > target_rank:
+           return value
+   return float("nan")
+
+def _sketch_to_json(sketch: dict) -> str:
+   """Serialize a sketch for the distance_sketches table."""
+   return json.dumps(sketch, sort_keys=True)
+
+def sketch_from_json(text: str) -> dict:
+   """Load a sketch stored by _sketch_to_json."""
+   sketch = json.loads(text)
+   for store in ("positive", "negative"):
+       sketch[store] = {int(index): count for index, count in sketch[store].items()}
+   return sketch
+
+def compute_moments(values) -> dict:
+   r"""
+   Compute the count, mean and sum of squared deviations (M2) of values.
+
+   Args:
+       values: Numbers to summarize; NaNs are ignored
+
+   Returns:
+       dict: count, mean and m2; the variance is m2 / (count - 1)
+   """
+   values = np.asarray(values, dtype=float)
+   values = values[~np.isnan(values)]
+   if len(values) == 0:
+       return {"count": 0, "mean": 0.0, "m2": 0.0}
+   mean = values.mean()
+   return {"count": int(len(values)), "mean": float(mean), "m2": float(((values - mean) ** 2).sum())}
+
+def merge_moments(moments: list[dict]) -> dict:
+   r"""
+   Combine moments of disjoint sets of values into the moments of their union.
+
+   Args:
+       moments: Results of compute_moments or merge_moments
+
+   Returns:
+       dict: count, mean and m2 of all the values
+
+   Notes:
+       - Uses the pairwise update of Chan et al., which avoids the
+         cancellation of the sum-of-squares formula
+   """
+   merged = {"count": 0, "mean": 0.0, "m2": 0.0}
+   for other in moments:
+       count = merged["count"] + other["count"]
+       if other["count"] == 0:
+           continue
+       delta = other["mean"] - merged["mean"]
+       merged = {
+           "count": count,
+           "mean": merged["mean"] + delta * other["count"] / count,
+           "m2": merged["m2"] + other["m2"] + delta ** 2 * merged["count"] * other["count"] / count
+       }
+   return merged
+
+def combine_distance_moments(moments: pd.DataFrame, by) -> pd.DataFrame:
+   r"""
+   Merge rows of distance_moments into moments per group.
+
+   Args:
+       moments: Rows of distance_moments (trips, mean_distance, m2_distance)
+       by: Column(s) to group by, such as "service" or a month number
+
+   Returns:
+       pd.DataFrame: count, mean, m2 and std (sample standard deviation)
+           for each group, with the group columns
+   """
+   moments = moments[moments['trips'] > 0].assign(
+       weighted_mean=lambda m: m['trips'] * m['mean_distance']
+   )
+   totals = moments.groupby(by)[['trips', 'weighted_mean']].transform('sum')
+   group_mean = totals['weighted_mean'] / totals['trips']
+
+   # Each part's M2 plus its count times its squared distance from the group mean
+   moments = moments.assign(
+       m2=moments['m2_distance'] + moments['trips'] * (moments['mean_distance'] - group_mean) ** 2
+   )
+   combined = moments.groupby(by).agg(
+       count=('trips', 'sum'), weighted_mean=('weighted_mean', 'sum'), m2=('m2', 'sum')
+   )
+   combined['mean'] = combined['weighted_mean'] / combined['count']
+   combined['std'] = np.sqrt(combined['m2'] / (combined['count'] - 1))
+   return combined[['count', 'mean', 'm2', 'std']].reset_index()
+
+def _monthly_distance_summaries(table_name: str, df: pd.DataFrame) -> list[dict]:
+   """Build the distance sketch and moments of each pickup month of a prepared trip DataFrame."""
+   service = TRIP_ROLLUP_SOURCES[table_name]["service"]
+   distance_column = DISTANCE_COLUMNS[table_name]
+   return [
+       {
+           "service": service,
+           "pickup_month": month,
+           "sketch": build_quantile_sketch(distances),
+           "moments": compute_moments(distances)
+       }
+       for month, distances in df.groupby('pickup_month')[distance_column]
+   ]
+
+def add_to_distance_summaries(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame) -> None:
+   r"""
+   Merge a batch of trips into the stored monthly distance sketches and moments.
+
+   Args:
+       conn: SQLite connection with an open transaction
+       table_name: Trip table the batch was written to
+       df: Batch of trips with pickup_month and the table's distance column
+   """
+   for row in _monthly_distance_summaries(table_name, df):
+       key = (row["service"], row["pickup_month"])
+       sketch = row["sketch"]
+       stored_sketch = conn.execute(
+           "SELECT sketch FROM distance_sketches WHERE service = ? AND pickup_month = ?", key
+       ).fetchone()
+       if stored_sketch is not None:
+           sketch = merge_quantile_sketches([sketch_from_json(stored_sketch[0]), sketch])
+       conn.execute(
+           "INSERT OR REPLACE INTO distance_sketches (service, pickup_month, trips, sketch) "
+           "VALUES (?, ?, ?, ?)",
+           (*key, sketch["count"], _sketch_to_json(sketch))
+       )
+
+       moments = row["moments"]
+       stored_moments = conn.execute(
+           "SELECT trips, mean_distance, m2_distance FROM distance_moments "
+           "WHERE service = ? AND pickup_month = ?", key
+       ).fetchone()
+       if stored_moments is not None:
+           moments = merge_moments([dict(zip(("count", "mean", "m2"), stored_moments)), moments])
+       conn.execute(
+           "INSERT OR REPLACE INTO distance_moments "
+           "(service, pickup_month, trips, mean_distance, m2_distance) VALUES (?, ?, ?, ?, ?)",
+           (*key, moments["count"], moments["mean"], moments["m2"])
+       )
+
+def rebuild_distance_summaries(conn) -> None:
+   r"""
+   Recompute distance_sketches and distance_moments from every trip.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+
+   Notes:
+       - Trips are read in chunks of BULK_LOAD_CHUNK_SIZE rows, so the trip
+         tables are never held in memory
+   """
+   raw_conn = conn.connection.driver_connection
+   raw_conn.execute("DELETE FROM distance_sketches")
+   raw_conn.execute("DELETE FROM distance_moments")
+   for table_name, distance_column in DISTANCE_COLUMNS.items():
+       for trips in pd.read_sql(
+           f'SELECT pickup_month, {distance_column} FROM "{table_name}"',
+           raw_conn,
+           chunksize=BULK_LOAD_CHUNK_SIZE
+       ):
+           add_to_distance_summaries(raw_conn, table_name, trips)
+   raw_conn.execute(BUMP_DATA_VERSION_SQL)
+
+def ensure_distance_summaries(conn) -> None:
+   r"""
+   Create distance_sketches and distance_moments, filling them from existing
+   trips if either is new.
+
+   Args:
+       conn: SQLAlchemy connection; the caller commits
+   """
+   existing_tables = {
+       row[0] for row in conn.execute(db.text(
+           "SELECT name FROM sqlite_master WHERE type = 'table' "
+           "AND name IN ('distance_sketches', 'distance_moments')"
+       ))
+   }
+   conn.execute(db.text(DISTANCE_SKETCHES_SCHEMA))
+   conn.execute(db.text(DISTANCE_MOMENTS_SCHEMA))
+   if len(existing_tables) < 2:
+       rebuild_distance_summaries(conn)
+
+def _to_sqlite_rows(df: pd.DataFrame) -> list[tuple]:
+   """Convert a DataFrame to row tuples of SQLite-compatible Python values."""
+   df = df.copy()
+   for col in df.columns:
+       if pd.api.types.is_datetime64_any_dtype(df[col]):
+           # Same text format SQLAlchemy uses for DATETIME values in SQLite
+           df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+       elif df[col].dtype == object:
+           # Columns of datetime.date values, such as daily_weather.date
+           first_value = df[col].dropna().iloc[:1]
+           if len(first_value) and hasattr(first_value.iloc[0], 'isoformat'):
+               df[col] = df[col].map(lambda v: v.isoformat() if hasattr(v, 'isoformat') else v)
+   df = df.astype(object).where(df.notna(), None)
+   return list(df.itertuples(index=False, name=None))
+
+def bulk_insert_dataframe(
+    conn: sqlite3.Connection,
+    table_name: str,
+    df: pd.DataFrame,
+    chunksize: int = BULK_LOAD_CHUNK_SIZE
+) -> int:
+   r"""
+   Insert a DataFrame into a table with chunked executemany calls.
+
+   Args:
+       conn: SQLite connection with an open transaction
+       table_name: Table to insert into
+       df: Rows to insert; column names must match the table
+       chunksize: Rows converted and inserted per executemany call
+
+   Returns:
+       int: Number of rows inserted
+   """
+   columns = ", ".join(f'"{col}"' for col in df.columns)
+   placeholders = ", ".join("?" for _ in df.columns)
+   insert_sql = f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders})'
+
+   for start in range(0, len(df), chunksize):
+       conn.executemany(insert_sql, _to_sqlite_rows(df.iloc[start:start + chunksize]))
+   return len(df)
+
+def create_database_tables(create_indexes: bool = True) -> None:
+   r"""
+   Create missing tables and bring older databases up to the current schema.
+
+   Args:
+       create_indexes: Also create TABLE_INDEXES; bulk loads build them
+           after inserting instead
 
+   Notes:
+       Also rewrites DATABASE_SCHEMA_FILE (see write_schema_file)
+   """
+   write_schema_file()
+   with engine.connect() as conn:
+       conn.execute(db.text(HOURLY_WEATHER_SCHEMA))
+       conn.execute(db.text(DAILY_WEATHER_SCHEMA))
+       conn.execute(db.text(TAXI_TRIPS_SCHEMA))
+       conn.execute(db.text(UBER_TRIPS_SCHEMA))
+       conn.execute(db.text(INGESTION_LEDGER_SCHEMA))
+       conn.execute(db.text(DATABASE_META_SCHEMA))
+       ensure_taxi_zones(conn)
+       ensure_trip_columns(conn)
+       ensure_trip_rollups(conn)
+       ensure_zone_rollups(conn)
+       ensure_distance_summaries(conn)
+       if create_indexes:
+           for index_sql in [sql for indexes in TABLE_INDEXES.values() for sql in indexes.values()]:
+               conn.execute(db.text(index_sql))
+       conn.commit()
 
-# create that required schema.sql file
-with open(DATABASE_SCHEMA_FILE, "w") as f:
-    f.write(HOURLY_WEATHER_SCHEMA)
-    f.write(DAILY_WEATHER_SCHEMA)
-    f.write(TAXI_TRIPS_SCHEMA)
-    f.write(UBER_TRIPS_SCHEMA)
+def prepare_dataframe_for_table(table_name: str, df: pd.DataFrame) -> pd.DataFrame:
+   r"""
+   Standardize column names and add DERIVED_TRIP_COLUMNS for trip tables.
 
-# create the tables with the schema files
-with engine.connect() as connection:
-    pass
+   Weather attached by add_hourly_weather is dropped from trips, since it is
+   kept once per hour in hourly_weather. float32 columns are widened and
+   rounded to their FLOAT32_DECIMALS, so the stored values are the source's
+   and not their nearest float32. Trips without a dropoff time are dropped:
+   their weekday_num is unknown, and both columns are NOT NULL in the trip
+   tables and trip_rollups.
+   """
+   float32_columns = [
+       col for col in df.columns if col in FLOAT32_DECIMALS and df[col].dtype == np.float32
+   ]
+   if float32_columns:
+       df = df.assign(**{
+           col: df[col].astype(np.float64).round(FLOAT32_DECIMALS[col]) for col in float32_columns
+       })
+   if table_name in TABLE_COLUMN_MAPPINGS:
+       df = df.rename(columns=TABLE_COLUMN_MAPPINGS[table_name])
+   if table_name in TRIP_TABLES:
+       df = df.drop(columns=[col for col in HOURLY_WEATHER_COLUMNS if col in df.columns])
+       df = add_derived_trip_columns(df)
+       missing_dropoff = df['dropoff_datetime'].isna()
+       if missing_dropoff.any():
+           print(f"Dropping {missing_dropoff.sum()} {table_name} rows without a dropoff time")
+           df = df[~missing_dropoff]
+   return df
 
-def write_dataframes_to_table(table_to_df_dict: dict[str, pd.DataFrame]) -> None:
+def write_dataframes_to_table(
+    table_to_df_dict: dict[str, pd.DataFrame],
+    bulk: bool = False,
+    chunksize: int = BULK_LOAD_CHUNK_SIZE
+) -> dict[str, dict]:
    r"""
    Write multiple DataFrames to their corresponding database tables.
 
    Args:
        table_to_df_dict: Dictionary mapping table names to DataFrames
+       bulk: Use the bulk loader instead of DataFrame.to_sql
+       chunksize: Rows per executemany batch in bulk mode
+
+   Returns:
+       dict: Rows written, seconds taken and rows per second for each table
 
    Notes:
        - Creates tables if they don't exist using predefined schemas
@@ -102,93 +1000,575 @@ def write_dataframes_to_table(table_to_df_dict: dict[str, pd.DataFrame]) -> None
            - taxi_trips: Yellow taxi trip records
            - uber_trips: Uber trip records
        - Standardizes column names before writing
-       - Appends data if table already exists
+       - Fills taxi_zones with the zone centroids trips refer to by LocationID
+       - Fills DERIVED_TRIP_COLUMNS for trip tables
+       - Adds each trip batch to trip_rollups, zone_rollups,
+         distance_sketches and distance_moments and bumps the data_version in database_meta, in the
+         same transaction as its rows
+       - Appends data if table already exists; ingest_all_sources loads
+         source files so that re-running it does not duplicate rows
+       - Bulk mode sets BULK_LOAD_PRAGMAS, drops the table's TABLE_INDEXES,
+         inserts each table in a single transaction and rebuilds the indexes
+         afterwards; the database's journal mode is switched back once the
+         load ends, which also removes the WAL files
    """
    # Create or verify tables exist
-   with engine.connect() as conn:
-       conn.execute(db.text(HOURLY_WEATHER_SCHEMA))
-       conn.execute(db.text(DAILY_WEATHER_SCHEMA))
-       conn.execute(db.text(TAXI_TRIPS_SCHEMA))
-       conn.execute(db.text(UBER_TRIPS_SCHEMA))
-       conn.commit()
-       
-       # Column mapping for each table
-       column_mappings = {
-           "hourly_weather": {
-               'date': 'date',
-               'hourly weather type': 'hourly_weather_type',
-               'hourly temperature': 'hourly_temperature',
-               'hourly precipitation': 'hourly_precipitation',
-               'hourly windspeed': 'hourly_windspeed',
-               'hour': 'hour',
-               'weekday_num': 'weekday_num',
-               'severe weather': 'severe_weather'
-           },
-           "daily_weather": {
-               'date': 'date',
-               'daily weather type': 'daily_weather_type',
-               'daily temperature': 'avg_temperature',
-               'daily precipitation': 'avg_precipitation',
-               'daily windspeed': 'avg_windspeed'
-           },
-           "taxi_trips": {
-               'pickup_datetime': 'pickup_datetime',
-               'dropoff_datetime': 'dropoff_datetime',
-               'RatecodeID': 'rate_code_id',
-               'trip_distance': 'trip_distance',
-               'extra': 'extra',
-               'mta_tax': 'mta_tax',
-               'tip_amount': 'tip_amount',
-               'tolls_amount': 'tolls_amount',
-               'improvement_surcharge': 'improvement_surcharge',
-               'total_amount': 'total_amount',
-               'congestion_surcharge': 'congestion_surcharge',
-               'Airport_fee': 'airport_fee',
-               'pickup_coords': 'pickup_coords',
-               'dropoff_coords': 'dropoff_coords',
-               'weekday_num': 'weekday_num',
-               'airport': 'airport'
-           },
-           "uber_trips": {
-               'hvfhs_license_num': 'hvfhs_license_num',
-               'pickup_datetime': 'pickup_datetime',
-               'dropoff_datetime': 'dropoff_datetime',
-               'trip_miles': 'trip_miles',
-               'base_passenger_fare': 'base_passenger_fare',
-               'tolls': 'tolls',
-               'sales_tax': 'sales_tax',
-               'congestion_surcharge': 'congestion_surcharge',
-               'airport_fee': 'airport_fee',
-               'driver_pay': 'driver_pay',
-               'bcf': 'bcf',
-               'pickup_coords': 'pickup_coords',
-               'dropoff_coords': 'dropoff_coords',
-               'weekday_num': 'weekday_num',
-               'total_amount': 'total_amount',
-               'airport': 'airport',
-               'tips': 'tips'
-           }
-       }
-       
+   create_database_tables(create_indexes=not bulk)
+
+   load_stats = {}
+   bulk_conn = None
+   if bulk:
+       bulk_conn = sqlite3.connect(engine.url.database, isolation_level=None)
+       journal_mode = bulk_conn.execute("PRAGMA journal_mode").fetchone()[0]
+       for pragma in BULK_LOAD_PRAGMAS:
+           bulk_conn.execute(pragma)
+
+   try:
        # Write each DataFrame to its table
        for table_name, df in table_to_df_dict.items():
-           # Standardize column names
-           if table_name in column_mappings:
-               df = df.rename(columns=column_mappings[table_name])
-           
-           # Write to database
-           df.to_sql(
-               name=table_name,
-               con=engine,
-               if_exists='append',
-               index=False
+           start_time = time.perf_counter()
+
+           with trace_stage("write_table", table=table_name, bulk=bulk) as span:
+               span["rows_in"] = len(df)
+               df = prepare_dataframe_for_table(table_name, df)
+
+               # Write to database
+               if bulk:
+                   table_indexes = TABLE_INDEXES.get(table_name, {})
+                   for index_name in table_indexes:
+                       bulk_conn.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+                   bulk_conn.execute("BEGIN")
+                   try:
+                       last_rowid = bulk_conn.execute(
+                           f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"'
+                       ).fetchone()[0]
+                       bulk_insert_dataframe(bulk_conn, table_name, df, chunksize)
+                       if table_name in TRIP_ROLLUP_SOURCES:
+                           bulk_conn.execute(trip_rollup_upsert_sql(table_name, last_rowid))
+                           bulk_conn.execute(zone_rollup_upsert_sql(table_name, last_rowid))
+                           add_to_distance_summaries(bulk_conn, table_name, df)
+                       bulk_conn.execute(BUMP_DATA_VERSION_SQL)
+                       bulk_conn.execute("COMMIT")
+                   except Exception:
+                       bulk_conn.execute("ROLLBACK")
+                       raise
+                   finally:
+                       for index_sql in table_indexes.values():
+                           bulk_conn.execute(index_sql)
+               else:
+                   with engine.begin() as conn:
+                       last_rowid = conn.execute(db.text(
+                           f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"'
+                       )).scalar()
+                       df.to_sql(
+                           name=table_name,
+                           con=conn,
+                           if_exists='append',
+                           index=False
+                       )
+                       if table_name in TRIP_ROLLUP_SOURCES:
+                           conn.execute(db.text(trip_rollup_upsert_sql(table_name, last_rowid)))
+                           conn.execute(db.text(zone_rollup_upsert_sql(table_name, last_rowid)))
+                           add_to_distance_summaries(conn.connection.driver_connection, table_name, df)
+                       conn.execute(db.text(BUMP_DATA_VERSION_SQL))
+
+               elapsed = time.perf_counter() - start_time
+               rows_per_second = len(df) / elapsed if elapsed > 0 else float('inf')
+               load_stats[table_name] = {
+                   "rows": len(df), "seconds": elapsed, "rows_per_second": rows_per_second
+               }
+               print(
+                   f"Successfully wrote {len(df)} rows to table {table_name} "
+                   f"in {elapsed:.2f}s ({rows_per_second:,.0f} rows/s)"
+               )
+               span["rows_out"] = len(df)
+   finally:
+       if bulk_conn is not None:
+           bulk_conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+           bulk_conn.close()
+
+   return load_stats
+
+
+# Parquet trip store
+
+# Tables kept next to the trip store in TRIP_STORE_SUMMARY_DATABASE, computed
+# with the same SQL as their SQLite counterparts, so part 3 reads the same
+# rollups and sketches from either backend
+TRIP_STORE_SUMMARY_SCHEMAS = {
+    "trip_rollups": TRIP_ROLLUPS_SCHEMA,
+    "zone_rollups": ZONE_ROLLUPS_SCHEMA,
+    "distance_sketches": DISTANCE_SKETCHES_SCHEMA,
+    "distance_moments": DISTANCE_MOMENTS_SCHEMA
+}
+TRIP_STORE_SUMMARY_DATABASE = "_summaries.db"  # in the store directory
+TRIP_STORE_PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16()), ("month", pa.int8())]), flavor="hive"
+)
+
+def summarize_trip_months(table_name: str, df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+   r"""
+   Compute the TRIP_STORE_SUMMARY_SCHEMAS tables for a batch of trips.
+
+   Args:
+       table_name: Trip table the batch belongs to
+       df: Trips prepared by prepare_dataframe_for_table
+
+   Returns:
+       dict: Rows of each summary table for the batch
+
+   Notes:
+       - The batch is loaded into an in-memory SQLite database and rolled up
+         with trip_rollup_upsert_sql, zone_rollup_upsert_sql and
+         add_to_distance_summaries, exactly as write_dataframes_to_table does
+   """
+   conn = sqlite3.connect(":memory:")
+   try:
+       conn.execute(TRIP_TABLE_SCHEMAS[table_name])
+       for schema in TRIP_STORE_SUMMARY_SCHEMAS.values():
+           conn.execute(schema)
+       bulk_insert_dataframe(conn, table_name, df)
+       conn.execute(trip_rollup_upsert_sql(table_name))
+       conn.execute(zone_rollup_upsert_sql(table_name))
+       add_to_distance_summaries(conn, table_name, df)
+       return {
+           summary_table: pd.read_sql_query(f"SELECT * FROM {summary_table}", conn)
+           for summary_table in TRIP_STORE_SUMMARY_SCHEMAS
+       }
+   finally:
+       conn.close()
+
+def write_trip_store(
+    table_to_df_dict: dict[str, pd.DataFrame],
+    root: str = TRIP_STORE_DIRECTORY,
+    ledger_entry: tuple[str, str, str] | None = None
+) -> dict[str, int]:
+   r"""
+   Write cleaned trips to the partitioned Parquet trip store.
+
+   Args:
+       table_to_df_dict: Dictionary mapping trip table names to DataFrames
+       root: Store directory
+       ledger_entry: (source_file, period, sha256) recorded in the store's
+           ingestion_ledger for each table, as replace_source_period does
+
+   Returns:
+       dict: Rows written to each table
+
+   Raises:
+       ValueError: If a table is not a trip table
+
+   Notes:
+       - Trips are written as hive partitions
+         <root>/service=<service>/year=<year>/month=<month>/, with the
+         columns and values the SQLite trip tables would get
+       - Every month the trips fall in is replaced, not appended to, so
+         writing a month again does not duplicate it
+       - The months' summaries, the ledger entry and a data_version bump are
+         committed to the store's summary database in one transaction after
+         the partitions are written; if that fails, writing the same trips
+         again repairs the store
+   """
+   os.makedirs(root, exist_ok=True)
+   rows_written = {}
+   summaries = {}
+   for table_name, df in table_to_df_dict.items():
+       if table_name not in TRIP_TABLE_SCHEMAS:
+           raise ValueError(f"{table_name} is not a trip table")
+       service = TRIP_ROLLUP_SOURCES[table_name]["service"]
+       with trace_stage("write_trip_store", table=table_name) as span:
+           span["rows_in"] = len(df)
+           df = prepare_dataframe_for_table(table_name, df)
+           pickup_datetime = pd.to_datetime(df['pickup_datetime'])
+           partitions = df.assign(
+               year=pickup_datetime.dt.year.astype(np.int16),
+               month=pickup_datetime.dt.month.astype(np.int8)
            )
-           print(f"Successfully wrote {len(df)} rows to table {table_name}")
+           ds.write_dataset(
+               pa.Table.from_pandas(partitions, preserve_index=False),
+               os.path.join(root, f"service={service}"),
+               format="parquet",
+               partitioning=TRIP_STORE_PARTITIONING,
+               existing_data_behavior="delete_matching",
+               basename_template="part-{i}.parquet"
+           )
+           summaries[table_name] = (service, summarize_trip_months(table_name, df))
+           rows_written[table_name] = len(df)
+           span["rows_out"] = len(df)
+
+   conn = sqlite3.connect(os.path.join(root, TRIP_STORE_SUMMARY_DATABASE), isolation_level=None)
+   try:
+       for schema in [*TRIP_STORE_SUMMARY_SCHEMAS.values(), INGESTION_LEDGER_SCHEMA, DATABASE_META_SCHEMA]:
+           conn.execute(schema)
+       conn.execute("BEGIN IMMEDIATE")
+       try:
+           for table_name, (service, tables) in summaries.items():
+               months = sorted(tables["trip_rollups"]["pickup_month"].unique())
+               placeholders = ", ".join("?" for _ in months)
+               for summary_table, rows in tables.items():
+                   conn.execute(
+                       f"DELETE FROM {summary_table} "
+                       f"WHERE service = ? AND pickup_month IN ({placeholders})",
+                       (service, *months)
+                   )
+                   bulk_insert_dataframe(conn, summary_table, rows)
+               if ledger_entry is not None:
+                   source_file, period, sha256 = ledger_entry
+                   conn.execute(
+                       RECORD_INGESTION_SQL,
+                       (table_name, source_file, period, sha256, rows_written[table_name],
+                        datetime.now(timezone.utc).isoformat())
+                   )
+           conn.execute(BUMP_DATA_VERSION_SQL)
+           conn.execute("COMMIT")
+       except Exception:
+           conn.execute("ROLLBACK")
+           raise
+   finally:
+       conn.close()
+
+   return rows_written
+
+def get_trip_store_ledger(table_name: str | None = None, root: str = TRIP_STORE_DIRECTORY) -> pd.DataFrame:
+   """Read the trip store's ingestion ledger, like get_ingestion_ledger."""
+   summary_database = os.path.join(root, TRIP_STORE_SUMMARY_DATABASE)
+   if not os.path.exists(summary_database):
+       return pd.DataFrame(columns=["table_name", "source_file", "period", "sha256", "rows", "ingested_at"])
+   conn = sqlite3.connect(summary_database)
+   try:
+       conn.execute(INGESTION_LEDGER_SCHEMA)
+       ledger = pd.read_sql_query("SELECT * FROM ingestion_ledger ORDER BY table_name, period", conn)
+   finally:
+       conn.close()
+   if table_name is not None:
+       ledger = ledger[ledger["table_name"] == table_name].reset_index(drop=True)
+   return ledger
+
+
+# Incremental ingestion
+
+def get_ingestion_ledger(table_name: str | None = None) -> pd.DataFrame:
+   r"""
+   Read the ingestion ledger.
+
+   Args:
+       table_name: Only return entries for this table
+
+   Returns:
+       pd.DataFrame: One row per ingested source file, as stored in
+           ingestion_ledger
+   """
+   query = "SELECT * FROM ingestion_ledger"
+   params = {}
+   if table_name is not None:
+       query += " WHERE table_name = :table_name"
+       params["table_name"] = table_name
+   with engine.connect() as conn:
+       conn.execute(db.text(INGESTION_LEDGER_SCHEMA))
+       return pd.read_sql(db.text(query + " ORDER BY table_name, period"), conn, params=params)
+
+def source_file_sha256(url: str, local_path: str) -> str:
+   """Return a source file's SHA-256, from the download manifest when recorded there."""
+   entry = load_manifest()["files"].get(os.path.basename(local_path), {})
+   if entry.get("url") == url and entry.get("sha256"):
+       return entry["sha256"]
+   return file_sha256(local_path)
+
+def replace_source_period(
+    table_to_df_dict: dict[str, pd.DataFrame],
+    source_file: str,
+    sha256: str,
+    period: str,
+    period_range: tuple[str, str],
+    chunksize: int = BULK_LOAD_CHUNK_SIZE
+) -> dict[str, int]:
+   r"""
+   Replace the rows of one period with a source file's data, in one transaction.
+
+   Args:
+       table_to_df_dict: Dictionary mapping table names to the file's cleaned
+           DataFrames
+       source_file: File name recorded in the ledger
+       sha256: Checksum of the source file
+       period: Ledger period ("YYYY-MM" or "YYYY")
+       period_range: First date of the period and first date after it, as
+           "YYYY-MM-DD" strings
+       chunksize: Rows per executemany batch
+
+   Returns:
+       dict: Rows written to each table
 
-map_table_name_to_dataframe = {
-    "taxi_trips": taxi_data,
-    "uber_trips": uber_data,
-    "hourly_weather": hourly_weather_data,
-    "daily_weather": daily_weather_data,
+   Notes:
+       - Existing rows of each table in the period are deleted first, whether
+         they came from the ledger or an earlier write_dataframes_to_table
+       - Rows outside the period are dropped so that re-ingesting the file
+         replaces everything it wrote
+       - trip_rollups, zone_rollups, distance_sketches and distance_moments
+         for the period are recomputed from the new rows and the data_version in
+         database_meta is bumped
+       - Nothing is changed if any step fails
+   """
+   conn = sqlite3.connect(engine.url.database, isolation_level=None)
+   rows_written = {}
+   try:
+       conn.execute("BEGIN IMMEDIATE")
+       try:
+           for table_name, df in table_to_df_dict.items():
+               with trace_stage("replace_source_period", table=table_name, source=source_file) as span:
+                   span["rows_in"] = len(df)
+                   df = prepare_dataframe_for_table(table_name, df)
+                   date_column = PERIOD_DATE_COLUMNS[table_name]
+                   dates = pd.to_datetime(df[date_column])
+                   in_period = (dates >= period_range[0]) & (dates < period_range[1])
+                   if not in_period.all():
+                       print(f"Dropping {(~in_period).sum()} rows of {source_file} outside {period}")
+                   df = df[in_period]
+
+                   conn.execute(
+                       f'DELETE FROM "{table_name}" WHERE {date_column} >= ? AND {date_column} < ?',
+                       period_range
+                   )
+                   if table_name in TRIP_ROLLUP_SOURCES:
+                       service = TRIP_ROLLUP_SOURCES[table_name]["service"]
+                       conn.execute(
+                           "DELETE FROM trip_rollups WHERE service = ? AND pickup_date >= ? AND pickup_date < ?",
+                           (service, *period_range)
+                       )
+                       for summary_table in ("zone_rollups", "distance_sketches", "distance_moments"):
+                           conn.execute(
+                               f"DELETE FROM {summary_table} "
+                               "WHERE service = ? AND pickup_month >= ? AND pickup_month < ?",
+                               (service, period_range[0][:7], period_range[1][:7])
+                           )
+
+                   # Read after the delete: SQLite may reuse the deleted rowids
+                   last_rowid = conn.execute(
+                       f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"'
+                   ).fetchone()[0]
+                   bulk_insert_dataframe(conn, table_name, df, chunksize)
+                   if table_name in TRIP_ROLLUP_SOURCES:
+                       conn.execute(trip_rollup_upsert_sql(table_name, last_rowid))
+                       conn.execute(zone_rollup_upsert_sql(table_name, last_rowid))
+                       add_to_distance_summaries(conn, table_name, df)
+
+                   conn.execute(
+                       RECORD_INGESTION_SQL,
+                       (table_name, source_file, period, sha256, len(df),
+                        datetime.now(timezone.utc).isoformat())
+                   )
+                   rows_written[table_name] = len(df)
+                   span["rows_out"] = len(df)
+           conn.execute(BUMP_DATA_VERSION_SQL)
+           conn.execute("COMMIT")
+       except Exception:
+           conn.execute("ROLLBACK")
+           raise
+   finally:
+       conn.close()
+
+   return rows_written
+
+# Monthly cleaner for each trip table
+TRIP_MONTH_CLEANERS = {
+    "taxi_trips": get_and_clean_taxi_month,
+    "uber_trips": get_and_clean_uber_month
 }
 
+def ingest_trip_months(
+    table_name: str,
+    parquet_urls: list[str],
+    workers: int = INGEST_WORKERS,
+    random_state: int = 42,
+    backend: str = TRIP_BACKEND
+) -> dict[str, list[str]]:
+   r"""
+   Load new or changed monthly TLC files into a trip table.
+
+   Args:
+       table_name: "taxi_trips" or "uber_trips"
+       parquet_urls: URLs or local paths of the monthly parquet files
+       workers: Number of worker processes used to clean months
+       random_state: Seed used when sampling each month
+       backend: "sqlite" or "parquet" (see TRIP_BACKEND)
+
+   Returns:
+       dict: Source files that were "ingested", "skipped" as unchanged, or
+           "failed"
+
+   Notes:
+       - A month is skipped when the backend's ledger has the same file with
+         the same checksum; only the remaining months are cleaned
+       - Each changed month replaces that month's rows (see
+         replace_source_period and write_trip_store)
+       - Files without a year and month in their name are not ingested
+   """
+   if backend == "parquet":
+       ledger = get_trip_store_ledger(table_name)
+   else:
+       create_database_tables()
+       ledger = get_ingestion_ledger(table_name)
+   ingested_checksums = dict(zip(ledger['source_file'], ledger['sha256']))
+   summary = {"ingested": [], "skipped": [], "failed": []}
+
+   pending = []
+   for url in parquet_urls:
+       source_file = os.path.basename(unquote(url))
+       month_range = month_range_from_url(url)
+       if month_range is None:
+           print(f"Skipping {url}: no month in the file name")
+           summary["failed"].append(source_file)
+           continue
+       try:
+           sha256 = source_file_sha256(url, fetch_source_file(url))
+       except Exception as e:
+           print(f"Error fetching {url}: {e}")
+           summary["failed"].append(source_file)
+           continue
+       if ingested_checksums.get(source_file) == sha256:
+           summary["skipped"].append(source_file)
+           continue
+       pending.append((url, source_file, sha256, month_range))
+
+   cleaned_months = clean_months(
+       TRIP_MONTH_CLEANERS[table_name], [url for url, *_ in pending], random_state, workers
+   )
+   for (url, source_file, sha256, month_range), trip_df in zip(pending, cleaned_months):
+       if trip_df is None:
+           summary["failed"].append(source_file)
+           continue
+       period = month_range[0].strftime('%Y-%m')
+       if backend == "parquet":
+           rows = write_trip_store({table_name: trip_df}, ledger_entry=(source_file, period, sha256))
+       else:
+           period_range = tuple(month.strftime('%Y-%m-%d') for month in month_range)
+           rows = replace_source_period({table_name: trip_df}, source_file, sha256, period, period_range)
+       print(f"Ingested {rows[table_name]} rows from {source_file} into {table_name}")
+       summary["ingested"].append(source_file)
+
+   print(
+       f"{table_name}: {len(summary['ingested'])} months ingested, "
+       f"{len(summary['skipped'])} unchanged, {len(summary['failed'])} failed"
+   )
+   return summary
+
+def ingest_weather_files(csv_files: list[str]) -> dict[str, list[str]]:
+   r"""
+   Load new or changed yearly weather CSVs into hourly_weather and daily_weather.
+
+   Args:
+       csv_files: Paths or URLs of the weather CSV files
+
+   Returns:
+       dict: Source files that were "ingested", "skipped" as unchanged, or
+           "failed"
+
+   Notes:
+       - The year is taken from the file name (e.g. 2020_weather.csv) and
+         each changed file replaces that year's rows in both tables
+       - A file whose checksum is not in the ledger is cleaned from the local
+         copy that was checksummed, so the rows written are that file's
+   """
+   create_database_tables()
+   ledger = get_ingestion_ledger("hourly_weather")
+   ingested_checksums = dict(zip(ledger['source_file'], ledger['sha256']))
+   summary = {"ingested": [], "skipped": [], "failed": []}
+
+   for csv_file in csv_files:
+       source_file = os.path.basename(unquote(csv_file))
+       year_match = re.search(r'(\d{4})', source_file)
+       if year_match is None:
+           print(f"Skipping {csv_file}: no year in the file name")
+           summary["failed"].append(source_file)
+           continue
+       try:
+           local_csv = fetch_source_file(csv_file)
+           sha256 = source_file_sha256(csv_file, local_csv)
+           if ingested_checksums.get(source_file) == sha256:
+               summary["skipped"].append(source_file)
+               continue
+           # Clean the copy that was just checksummed
+           hourly_data, daily_data = clean_weather_file(local_csv)
+       except Exception as e:
+           print(f"Error processing {csv_file}: {e}")
+           summary["failed"].append(source_file)
+           continue
+
+       year = int(year_match.group(1))
+       rows = replace_source_period(
+           {"hourly_weather": hourly_data, "daily_weather": daily_data},
+           source_file, sha256, str(year), (f"{year}-01-01", f"{year + 1}-01-01")
+       )
+       print(
+           f"Ingested {rows['hourly_weather']} hourly and {rows['daily_weather']} "
+           f"daily rows from {source_file}"
+       )
+       summary["ingested"].append(source_file)
+
+   return summary
+
+def ingest_all_sources(
+    workers: int = INGEST_WORKERS,
+    refresh: bool = True,
+    tlc_url: str = TLC_URL
+) -> dict[str, dict]:
+   r"""
+   Bring the database up to date with every taxi, Uber and weather source file.
+
+   Args:
+       workers: Number of worker processes used to clean trip months
+       refresh: Scrape the TLC page for new monthly files instead of using
+           the URLs in the manifest; ignored in offline mode
+       tlc_url: URL of the TLC trip record page
+
+   Returns:
+       dict: Summary of ingest_trip_months or ingest_weather_files for
+           "taxi_trips", "uber_trips" and "weather"
+
+   Notes:
+       - Months already ingested are only downloaded again if they changed
+         upstream (see fetch_source_file)
+       - Prints the run's per-stage timings (see summarize_trace) unless
+         tracing is turned off with TLC_TRACE=0
+   """
+   source_urls = discover_source_urls(tlc_url, refresh=refresh)
+   summary = {
+       "taxi_trips": ingest_trip_months("taxi_trips", source_urls["taxi"], workers),
+       "uber_trips": ingest_trip_months("uber_trips", source_urls["uber"], workers),
+       "weather": ingest_weather_files(get_all_weather_csvs(WEATHER_CSV_DIR))
+   }
+   if TRACING_ENABLED:
+       print(f"Stage timings (full records in {TRACE_FILE}, run {TRACE_RUN_ID}):")
+       print(summarize_trace().to_string(index=False))
+   return summary
+
+def clean_all_sources(workers: int = INGEST_WORKERS) -> dict[str, pd.DataFrame]:
+   r"""
+   Clean every taxi, Uber and weather source file in memory.
+
+   Args:
+       workers: Number of worker processes used to clean trip months
+
+   Returns:
+       dict: DataFrame for each table, as taken by write_dataframes_to_table
+
+   Notes:
+       Unlike ingest_all_sources this reloads every month; it is the path
+       of the notebook's map_table_name_to_dataframe
+   """
+   hourly_weather_data, daily_weather_data = load_and_clean_weather_data()
+   return {
+       "taxi_trips": get_taxi_data(workers),
+       "uber_trips": get_uber_data(workers),
+       "hourly_weather": hourly_weather_data,
+       "daily_weather": daily_weather_data,
+   }
+
+# Notebook run only; uses the frames cleaned in the notebook's part 1 cells
+if __name__ == "__main__":
+    map_table_name_to_dataframe = {
+        "taxi_trips": taxi_data,
+        "uber_trips": uber_data,
+        "hourly_weather": hourly_weather_data,
+        "daily_weather": daily_weather_data,
+    }
+
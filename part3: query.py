@@ -1,19 +1,348 @@
+# Ride counts come from the trip_rollups table, zone counts from zone_rollups
+# and the Q3 distance percentile from the distance_sketches table, all
+# maintained by part 2. With the Parquet trip backend these tables are read
+# from the trip store's summary database (see connect_trip_backend)
+
+QUERY_WORKERS = 4  # queries run at the same time, each on its own connection
+QUERY_CACHE_DIRECTORY = os.path.join(QUERY_DIRECTORY, ".cache")
+
+def connect_read_only() -> sqlite3.Connection:
+   """Open a read-only connection to the project database."""
+   return sqlite3.connect(f"file:{engine.url.database}?mode=ro", uri=True)
+
+def read_data_version(conn: sqlite3.Connection) -> int | None:
+   r"""
+   Read the data version that part 2 bumps on every load.
+
+   Args:
+       conn: Connection to the project database
+
+   Returns:
+       int: Current data version
+       str: Combined trip store and database versions, on a connection from
+           connect_trip_store
+       None: If the database predates database_meta or was never loaded
+   """
+   try:
+       row = conn.execute(
+           "SELECT value FROM database_meta WHERE key = 'data_version'"
+       ).fetchone()
+   except sqlite3.OperationalError:
+       return None
+   return None if row is None else row[0]
+
+def connect_trip_store(root: str = TRIP_STORE_DIRECTORY) -> sqlite3.Connection:
+   r"""
+   Open a read-only connection that answers part 3 queries from the trip store.
+
+   Args:
+       root: Trip store directory written by write_trip_store
+
+   Returns:
+       sqlite3.Connection: The store's summary database, with the project
+           database attached as "project" for weather and taxi zones
+
+   Raises:
+       FileNotFoundError: If nothing was written to the store yet
+
+   Notes:
+       - Unqualified table names resolve to the store's trip_rollups,
+         zone_rollups, distance_sketches and distance_moments first
+       - database_meta is shadowed by a view whose data_version combines the
+         store's and the project database's, so cached results are dropped
+         when either changes
+       - Raw trips are not reachable through SQL; read them with
+         read_trip_store
+   """
+   summary_database = os.path.join(root, TRIP_STORE_SUMMARY_DATABASE)
+   if not os.path.exists(summary_database):
+       raise FileNotFoundError(f"No trip store summaries in {root}; run write_trip_store first")
+   conn = sqlite3.connect(f"file:{summary_database}?mode=ro", uri=True)
+
+   project_version = "NULL"
+   if os.path.exists(engine.url.database):
+       conn.execute("ATTACH DATABASE ? AS project", (f"file:{engine.url.database}?mode=ro",))
+       if conn.execute(
+           "SELECT 1 FROM project.sqlite_master WHERE type = 'table' AND name = 'database_meta'"
+       ).fetchone():
+           project_version = "(SELECT value FROM project.database_meta WHERE key = 'data_version')"
+   conn.execute(f"""
+       CREATE TEMP VIEW database_meta AS
+       SELECT key, 'parquet-' || value || '-' || COALESCE({project_version}, 0) AS value
+       FROM main.database_meta
+   """)
+   return conn
+
+def connect_trip_backend(backend: str = TRIP_BACKEND) -> sqlite3.Connection:
+   """Open a read-only connection for part 3 queries on the "sqlite" or "parquet" trip backend."""
+   if backend == "parquet":
+       return connect_trip_store()
+   if backend != "sqlite":
+       raise ValueError(f"Unknown trip backend: {backend}")
+   return connect_read_only()
+
+def trip_store_partition_filter(start_date: str | None = None, end_date: str | None = None):
+   r"""
+   Build a filter on the store's year/month partitions for a pickup date range.
+
+   Args:
+       start_date: First pickup date included ("YYYY-MM-DD")
+       end_date: First pickup date excluded ("YYYY-MM-DD")
+
+   Returns:
+       ds.Expression: Filter matching the months overlapping the range
+       None: If neither bound is given
+   """
+   year, month = ds.field("year"), ds.field("month")
+   conditions = []
+   if start_date is not None:
+       start = pd.Timestamp(start_date)
+       conditions.append((year > start.year) | ((year == start.year) & (month >= start.month)))
+   if end_date is not None:
+       # The month of the last included day
+       last = pd.Timestamp(end_date) - pd.Timedelta(days=1)
+       conditions.append((year < last.year) | ((year == last.year) & (month <= last.month)))
+   if not conditions:
+       return None
+   return conditions[0] if len(conditions) == 1 else conditions[0] & conditions[1]
+
+def read_trip_store(
+    service: str,
+    columns: list[str] | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    root: str = TRIP_STORE_DIRECTORY
+) -> pd.DataFrame:
+   r"""
+   Read trips of one service from the Parquet trip store.
+
+   Args:
+       service: "taxi" or "uber"
+       columns: Columns to read, named as in the SQLite trip tables
+           (default all, including the year and month partition keys)
+       start_date: First pickup date included ("YYYY-MM-DD")
+       end_date: First pickup date excluded ("YYYY-MM-DD")
+       root: Trip store directory
+
+   Returns:
+       pd.DataFrame: Matching trips
+
+   Notes:
+       - Only the partitions of the months overlapping the date range are
+         opened and only the requested columns are read
+   """
+   with trace_stage("read_trip_store", service=service) as span:
+       dataset = ds.dataset(
+           os.path.join(root, f"service={service}"),
+           format="parquet",
+           partitioning=TRIP_STORE_PARTITIONING
+       )
+       # The partition filter prunes whole months; the pickup_date bounds
+       # trim the first and last month
+       row_filter = trip_store_partition_filter(start_date, end_date)
+       if start_date is not None:
+           row_filter &= ds.field("pickup_date") >= start_date
+       if end_date is not None:
+           row_filter &= ds.field("pickup_date") < end_date
+       trips = dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+       span["rows_out"] = len(trips)
+   return trips
+
+def cached_result(
+    cache_text: str,
+    data_version: int | None,
+    compute,
+    use_cache: bool = True
+) -> pd.DataFrame:
+   r"""
+   Compute a result, reusing the stored one if the data has not changed since.
+
+   Args:
+       cache_text: Text identifying the computation, such as its SQL
+       data_version: Data version the result is valid for (see
+           read_data_version); None disables the cache
+       compute: Function without arguments returning the result DataFrame
+       use_cache: Read and write cached results
+
+   Returns:
+       pd.DataFrame: Result of compute, possibly from the cache
+
+   Notes:
+       - Results are cached as parquet files in QUERY_CACHE_DIRECTORY, keyed
+         on cache_text and the data version
+       - Sets cache_hit on the enclosing traced stage (see annotate_stage)
+   """
+   if not use_cache or data_version is None:
+       annotate_stage(cache_hit=False)
+       return compute()
+
+   cache_key = hashlib.sha256(f"{data_version}\n{cache_text}".encode()).hexdigest()
+   cache_file = os.path.join(QUERY_CACHE_DIRECTORY, f"{cache_key}.parquet")
+   cache_hit = os.path.exists(cache_file)
+   annotate_stage(cache_hit=cache_hit)
+   if cache_hit:
+       return pd.read_parquet(cache_file)
+
+   result = compute()
+   os.makedirs(QUERY_CACHE_DIRECTORY, exist_ok=True)
+   result.to_parquet(f"{cache_file}.{threading.get_ident()}.tmp")
+   os.replace(f"{cache_file}.{threading.get_ident()}.tmp", cache_file)
+   return result
+
+def run_query(
+    query: str,
+    conn: sqlite3.Connection,
+    data_version: int | None = None,
+    use_cache: bool = True
+) -> pd.DataFrame:
+   r"""
+   Run a query, reusing the stored result if the data has not changed since.
+
+   Args:
+       query: SQL query text
+       conn: Connection to the project database
+       data_version: Data version the result is valid for; None disables the cache
+       use_cache: Read and write cached results
+
+   Returns:
+       pd.DataFrame: Query result
+   """
+   return cached_result(query, data_version, lambda: pd.read_sql_query(query, conn), use_cache)
+
+def run_compute(
+    compute,
+    conn: sqlite3.Connection,
+    params: dict | None = None,
+    data_version: int | None = None,
+    use_cache: bool = True
+) -> pd.DataFrame:
+   r"""
+   Run an analysis function, reusing the stored result if the data has not changed since.
+
+   Args:
+       compute: Function called with the connection and params, returning a DataFrame
+       conn: Connection to the project database
+       params: Keyword arguments for compute
+       data_version: Data version the result is valid for; None disables the cache
+       use_cache: Read and write cached results
+
+   Returns:
+       pd.DataFrame: Result of compute
+   """
+   params = params or {}
+   return cached_result(
+       f"{compute.__name__}{sorted(params.items())}",
+       data_version,
+       lambda: compute(conn, **params),
+       use_cache
+   )
+
+def query_zone_trip_counts(
+    conn: sqlite3.Connection,
+    start_month: str | None = None,
+    end_month: str | None = None,
+    services: tuple[str, ...] = ("taxi", "uber"),
+    trip_end: str = "pickup"
+) -> pd.DataFrame:
+   r"""
+   Count trips per taxi zone from the monthly zone rollups.
+
+   Args:
+       conn: Connection to the project database
+       start_month: First pickup month included ("YYYY-MM"); None starts at
+           the first loaded month
+       end_month: Last pickup month included ("YYYY-MM"); None ends at the
+           last loaded month
+       services: Services whose trips are counted ("taxi", "uber")
+       trip_end: Count trips by their "pickup" or "dropoff" zone
+
+   Returns:
+       pd.DataFrame: location_id, latitude, longitude and trips per zone,
+           for zones with a known centroid
+
+   Notes:
+       - Reads at most one row per zone and month from zone_rollups, so the
+         cost does not depend on the number of trips
+   """
+   conditions = ["r.trip_end = ?", f"r.service IN ({', '.join('?' for _ in services)})"]
+   params = [trip_end, *services]
+   if start_month is not None:
+       conditions.append("r.pickup_month >= ?")
+       params.append(start_month)
+   if end_month is not None:
+       conditions.append("r.pickup_month <= ?")
+       params.append(end_month)
+   return pd.read_sql_query(
+       f"""
+       SELECT r.location_id, z.latitude, z.longitude, SUM(r.trips) AS trips
+       FROM zone_rollups r
+       JOIN taxi_zones z ON z.location_id = r.location_id
+       WHERE {" AND ".join(conditions)}
+       GROUP BY r.location_id, z.latitude, z.longitude
+       ORDER BY r.location_id
+       """,
+       conn,
+       params=tuple(params)
+   )
+
+def query_distance_percentiles(
+    conn: sqlite3.Connection,
+    percentiles: tuple[float, ...] = (95,),
+    start_month: str = "2020-01",
+    end_month: str = "2024-08",
+    services: tuple[str, ...] = ("taxi", "uber")
+) -> pd.DataFrame:
+   r"""
+   Estimate trip distance percentiles from the monthly distance sketches.
+
+   Args:
+       conn: Connection to the project database
+       percentiles: Percentiles to estimate (0-100)
+       start_month: First pickup month included ("YYYY-MM")
+       end_month: Last pickup month included ("YYYY-MM")
+       services: Services whose trips are combined ("taxi", "uber")
+
+   Returns:
+       pd.DataFrame: One row with a percentile_<p> column per percentile,
+           rounded to 2 decimals
+
+   Notes:
+       - Merges the sketches part 2 keeps in distance_sketches, so the cost
+         does not depend on the number of trips; estimates are within
+         DISTANCE_SKETCH_RELATIVE_ACCURACY of the exact percentile
+   """
+   placeholders = ", ".join("?" for _ in services)
+   rows = conn.execute(
+       f"SELECT sketch FROM distance_sketches "
+       f"WHERE pickup_month BETWEEN ? AND ? AND service IN ({placeholders})",
+       (start_month, end_month, *services)
+   ).fetchall()
+   sketch = merge_quantile_sketches([sketch_from_json(row[0]) for row in rows])
+   return pd.DataFrame({
+       f"percentile_{p:g}": [round(sketch_quantile(sketch, p / 100), 2)] for p in percentiles
+   })
+
 # Helper function to write the queries to file
 def write_query_to_file(query, outfile):
-    df = pd.read_sql(query, engine)
+    conn = connect_read_only()
+    try:
+        df = run_query(query, conn, read_data_version(conn))
+    finally:
+        conn.close()
     df.to_csv(outfile, index=False)
 
 ### Q1
 QUERY_1 = """
 WITH hourly_counts AS (
     SELECT 
-        CAST(strftime('%H', pickup_datetime) AS INTEGER) as X,
-        COUNT(*) as Y
-    FROM taxi_trips
+        pickup_hour as X,
+        SUM(trips) as Y
+    FROM trip_rollups
     WHERE 
-        pickup_datetime >= '2020-01-01' 
-        AND pickup_datetime < '2024-09-01'
-    GROUP BY strftime('%H', pickup_datetime)
+        service = 'taxi'
+        AND pickup_date >= '2020-01-01' 
+        AND pickup_date < '2024-09-01'
+    GROUP BY pickup_hour
 )
 SELECT 
     X,
@@ -22,21 +351,18 @@ SELECT
 FROM hourly_counts
 ORDER BY X;
 """
-conn = sqlite3.connect('project.db')
-hourly_stats = pd.read_sql_query(QUERY_1, conn)
-conn.close()
-hourly_stats.to_csv("hourly_taxi_popularity.csv", index=False)
 
 
 QUERY_2 = """
 WITH daily_counts AS (
     SELECT 
         weekday_num as X,
-        COUNT(*) as Y
-    FROM uber_trips
+        SUM(trips) as Y
+    FROM trip_rollups
     WHERE 
-        pickup_datetime >= '2020-01-01' 
-        AND pickup_datetime < '2024-09-01'
+        service = 'uber'
+        AND pickup_date >= '2020-01-01' 
+        AND pickup_date < '2024-09-01'
     GROUP BY weekday_num
 )
 SELECT 
@@ -47,12 +373,10 @@ FROM daily_counts
 ORDER BY Y DESC;
 """
 
-conn = sqlite3.connect('project.db')
-daily_stats = pd.read_sql_query(QUERY_2, conn)
-conn.close()
-daily_stats.to_csv("daily_uber_popularity.csv", index=False)
 
 ### Q3
+# Exact percentile over every trip; the registry answers Q3 from the distance
+# sketches instead (query_distance_percentiles)
 QUERY_3 = """
 WITH combined_trips AS (
     SELECT trip_distance as distance
@@ -81,10 +405,6 @@ ORDER BY distance ASC
 LIMIT 1;
 """
 
-conn = sqlite3.connect('project.db')
-daily_stats = pd.read_sql_query(QUERY_3, conn)
-conn.close()
-daily_stats.to_csv("ride_distance_percentile.csv", index=False)
 
 ### Q4
 QUERY_4 = """
@@ -97,14 +417,10 @@ WITH SnowDays AS (
 ),
 DailyRideCounts AS (
     SELECT 
-        DATE(pickup_datetime) AS ride_date,
-        COUNT(*) AS total_rides
-    FROM (
-        SELECT pickup_datetime FROM taxi_trips
-        UNION ALL
-        SELECT pickup_datetime FROM uber_trips
-    )
-    GROUP BY DATE(pickup_datetime)
+        pickup_date AS ride_date,
+        SUM(trips) AS total_rides
+    FROM trip_rollups
+    GROUP BY pickup_date
 )
 SELECT 
     s.snow_date AS date,
@@ -117,14 +433,6 @@ ORDER BY s.total_precipitation DESC
 LIMIT 10;
 """
 
-conn = sqlite3.connect('project.db')
-df = pd.read_sql_query(QUERY_4, conn)
-df.to_csv(("buiest_trip.csv", index=False)
-conn.close()
-
-
-
-
 ### Q5
 QUERY_5_FILENAME = "snowiest_days_rides.csv"
 QUERY_5 = """
@@ -137,14 +445,10 @@ WITH SnowDays AS (
 ),
 DailyRideCounts AS (
     SELECT 
-        DATE(pickup_datetime) AS ride_date,
-        COUNT(*) AS total_rides
-    FROM (
-        SELECT pickup_datetime FROM taxi_trips
-        UNION ALL
-        SELECT pickup_datetime FROM uber_trips
-    )
-    GROUP BY DATE(pickup_datetime)
+        pickup_date AS ride_date,
+        SUM(trips) AS total_rides
+    FROM trip_rollups
+    GROUP BY pickup_date
 )
 SELECT 
     s.snow_date AS date,
@@ -157,18 +461,11 @@ ORDER BY s.total_precipitation DESC
 LIMIT 10;
 """
 
-conn = sqlite3.connect('project.db')
-df = pd.read_sql_query(QUERY_5, conn)
-df.to_csv(QUERY_5_FILENAME, index=False)
-conn.close()
 
 ### Q6
-# Database connection configuration
-conn = sqlite3.connect('project.db')
-cursor = conn.cursor()
-
 # SQL query to generate hourly data with weather and ride counts
-query = """
+QUERY_6_FILENAME = "hourly_rides_and_weather.csv"
+QUERY_6 = """
 WITH RECURSIVE GeneratedHours AS (
    SELECT datetime('2023-09-25 00:00:00') AS hour
    UNION ALL
@@ -189,15 +486,11 @@ HourlyWeatherData AS (
 
 HourlyRideCounts AS (
    SELECT 
-       strftime('%Y-%m-%d %H:00:00', pickup_datetime) AS hour,
-       COUNT(*) AS total_rides
-   FROM (
-       SELECT pickup_datetime FROM taxi_trips
-       UNION ALL
-       SELECT pickup_datetime FROM uber_trips
-   )
-   WHERE pickup_datetime BETWEEN '2023-09-25 00:00:00' AND '2023-10-03 23:59:59'
-   GROUP BY strftime('%Y-%m-%d %H:00:00', pickup_datetime)
+       printf('%s %02d:00:00', pickup_date, pickup_hour) AS hour,
+       SUM(trips) AS total_rides
+   FROM trip_rollups
+   WHERE pickup_date BETWEEN '2023-09-25' AND '2023-10-03'
+   GROUP BY pickup_date, pickup_hour
 ),
 
 CombinedData AS (
@@ -220,17 +513,78 @@ FROM CombinedData
 ORDER BY datetime ASC;
 """
 
-try:
-   # Execute query and fetch results
-   cursor.execute(query)
-   result_tuples = cursor.fetchall()
+# Named analyses and the CSV file each one is written to. An entry has either
+# a SQL "query" or a "compute" function called with a connection and "params"
+QUERY_REGISTRY = {
+    "hourly_taxi_popularity": {"query": QUERY_1, "output": "hourly_taxi_popularity.csv"},
+    "daily_uber_popularity": {"query": QUERY_2, "output": "daily_uber_popularity.csv"},
+    "ride_distance_percentile": {
+        "compute": query_distance_percentiles,
+        "params": {"percentiles": (95,), "start_month": "2024-01", "end_month": "2024-01"},
+        "output": "ride_distance_percentile.csv"
+    },
+    "snowiest_days": {"query": QUERY_4, "output": "buiest_trip.csv"},
+    "snowiest_days_rides": {"query": QUERY_5, "output": QUERY_5_FILENAME},
+    "hourly_rides_and_weather": {"query": QUERY_6, "output": QUERY_6_FILENAME}
+}
+
+def run_queries(
+    names: list[str] | None = None,
+    workers: int = QUERY_WORKERS,
+    use_cache: bool = True,
+    backend: str = TRIP_BACKEND
+) -> dict[str, pd.DataFrame]:
+   r"""
+   Run registered queries concurrently and write each result to its CSV file.
+
+   Args:
+       names: Keys of QUERY_REGISTRY to run (default all)
+       workers: Number of queries run at the same time
+       use_cache: Reuse results cached for the current data version
+       backend: Trip backend queried, "sqlite" or "parquet" (see
+           connect_trip_backend)
+
+   Returns:
+       dict: Result DataFrame for each query name
+
+   Notes:
+       - Each query runs on its own read-only connection
+       - Results are cached under the data version read at the start of the
+         run, so runs should not overlap with a load
+   """
+   names = list(QUERY_REGISTRY) if names is None else names
+   conn = connect_trip_backend(backend)
+   try:
+       data_version = read_data_version(conn)
+   finally:
+       conn.close()
+
+   def run_registered_query(name: str) -> pd.DataFrame:
+       entry = QUERY_REGISTRY[name]
+       with trace_stage("query", name=name, use_cache=use_cache, backend=backend) as span:
+           conn = connect_trip_backend(backend)
+           try:
+               if "query" in entry:
+                   result = run_query(entry["query"], conn, data_version, use_cache)
+               else:
+                   result = run_compute(entry["compute"], conn, entry.get("params"), data_version, use_cache)
+           finally:
+               conn.close()
+           span["rows_out"] = len(result)
+       return result
+
+   with ThreadPoolExecutor(max_workers=workers) as executor:
+       results = dict(zip(names, executor.map(run_registered_query, names)))
+
+   for name, result in results.items():
+       output = QUERY_REGISTRY[name]["output"]
+       os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+       result.to_csv(output, index=False)
+   return results
 
-   # Display results
-   for row in result_tuples:
-       print(row)
+# Notebook run only; cli.py query runs the registry from the command line
+if __name__ == "__main__":
+    query_results = run_queries()
 
-finally:
-   # Ensure database connection is properly closed
-   cursor.close()
-   conn.commit()
-   conn.close()
+    # Display the hourly rides and weather (Q6)
+    print(query_results["hourly_rides_and_weather"].to_string(index=False))
@@ -1,5 +1,33 @@
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import seaborn as sns
+
+# Every figure is drawn from query results read with read_figure_inputs, so
+# it can be rendered without the trips in memory (see render_report)
+
+def read_figure_inputs(input_queries: dict[str, str], use_cache: bool = True) -> dict[str, pd.DataFrame]:
+   r"""
+   Run the queries a figure is drawn from.
+
+   Args:
+       input_queries: Plot function argument name -> SQL query
+       use_cache: Reuse results cached for the current data version
+
+   Returns:
+       dict: Query result for each argument name
+   """
+   conn = connect_read_only()
+   try:
+       data_version = read_data_version(conn)
+       return {
+           name: run_query(query, conn, data_version, use_cache)
+           for name, query in input_queries.items()
+       }
+   finally:
+       conn.close()
+
 ### v1:
-def plot_hourly_taxi_distribution(dataframe: pd.DataFrame) -> None:
+def plot_hourly_taxi_distribution(dataframe: pd.DataFrame, show: bool = True) -> plt.Figure:
    r"""
    Create a two-panel visualization of hourly taxi ride distribution.
 
@@ -8,6 +36,10 @@ def plot_hourly_taxi_distribution(dataframe: pd.DataFrame) -> None:
            - X: Hour of day (0-23)
            - Y: Number of rides
            - percentage: Percentage of total rides
+       show: Show the figure; False only draws it, e.g. for saving
+
+   Returns:
+       plt.Figure: The drawn figure
 
    Notes:
        Creates two plots:
@@ -43,7 +75,9 @@ def plot_hourly_taxi_distribution(dataframe: pd.DataFrame) -> None:
        ax2.text(i, v, f'{v:.2f}%', ha='center', va='bottom')
    
    plt.tight_layout()
-   plt.show()
+   if show:
+       plt.show()
+   return figure
 
 
 def get_hourly_taxi_data() -> pd.DataFrame:
@@ -55,152 +89,155 @@ def get_hourly_taxi_data() -> pd.DataFrame:
    """
    return pd.read_csv('hourly_taxi_popularity.csv')
 
-### v2:
-uber_data.rename(columns={'trip_miles': 'trip_distance'}, inplace=True)
-
-combined_trips = pd.concat([taxi_data[['pickup_datetime', 'trip_distance']],
-                            uber_data[['pickup_datetime', 'trip_distance']]])
-
-start_date = '2020-01-01'
-end_date = '2024-08-31'
-combined_trips = combined_trips[(combined_trips['pickup_datetime'] >= start_date) &
-                                (combined_trips['pickup_datetime'] <= end_date)]
-
-combined_trips['month'] = combined_trips['pickup_datetime'].dt.month
-
-# Group by month and calculate average distance and confidence interval
-monthly_avg_distance = combined_trips.groupby('month')['trip_distance'].agg(['mean', 'count', 'std'])
-z_value = 1.645  # for 90% CI
-
-# Calculate 90% CI
-monthly_avg_distance['sem'] = monthly_avg_distance['std'] / np.sqrt(monthly_avg_distance['count'])  
-monthly_avg_distance['ci'] = z_value * monthly_avg_distance['sem']  
+# Same rows as the hourly_taxi_popularity.csv written by part 3
+HOURLY_TAXI_INPUTS = {"dataframe": QUERY_1}
 
-# plotting
-monthly_avg_distance.reset_index(inplace=True)
-months = monthly_avg_distance['month'].values.astype(float)
-mean_values = monthly_avg_distance['mean'].values.astype(float)
-lower_bound = (mean_values - monthly_avg_distance['ci'].values).astype(float)
-upper_bound = (mean_values + monthly_avg_distance['ci'].values).astype(float)
+### v2:
+# Per-month distance moments of both services, maintained by part 2 as trips
+# are loaded, so no trips are read here
+MONTHLY_DISTANCE_INPUTS = {"distance_moments": """
+SELECT service, pickup_month, trips, mean_distance, m2_distance
+FROM distance_moments
+WHERE pickup_month BETWEEN '2020-01' AND '2024-08'
+"""}
+
+def plot_monthly_average_distance(distance_moments: pd.DataFrame, show: bool = True) -> plt.Figure:
+   r"""
+   Plot the average trip distance per calendar month with a 90% confidence interval.
 
-plt.figure(figsize=(15, 12))
-sns.lineplot(x=months, y=mean_values, label='Average Distance', color='blue')
-plt.fill_between(months, lower_bound, upper_bound, color='b', alpha=0.2, label='90% Confidence Interval')
+   Args:
+       distance_moments: Rows of distance_moments for the months to include
+       show: Show the figure; False only draws it
 
-plt.xlabel('Month')
-plt.ylabel('Average Distance (miles)')
-plt.title('Average Distance Traveled per Month (January 2020 - August 2024)\nTaxis and Ubers Combined')
-plt.xticks(ticks=range(1, 13), labels=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
-plt.legend()
-plt.grid(visible=True)
+   Returns:
+       plt.Figure: The drawn figure
+   """
+   distance_moments = distance_moments.assign(month=distance_moments['pickup_month'].str[5:7].astype(int))
+
+   # Merge every year's taxi and Uber moments by calendar month
+   monthly_avg_distance = combine_distance_moments(distance_moments, 'month')
+   z_value = 1.645  # for 90% CI
+
+   # Calculate 90% CI
+   monthly_avg_distance['sem'] = monthly_avg_distance['std'] / np.sqrt(monthly_avg_distance['count'])
+   monthly_avg_distance['ci'] = z_value * monthly_avg_distance['sem']
+
+   # plotting
+   months = monthly_avg_distance['month'].values.astype(float)
+   mean_values = monthly_avg_distance['mean'].values.astype(float)
+   lower_bound = (mean_values - monthly_avg_distance['ci'].values).astype(float)
+   upper_bound = (mean_values + monthly_avg_distance['ci'].values).astype(float)
+
+   figure = plt.figure(figsize=(15, 12))
+   sns.lineplot(x=months, y=mean_values, label='Average Distance', color='blue')
+   plt.fill_between(months, lower_bound, upper_bound, color='b', alpha=0.2, label='90% Confidence Interval')
+
+   plt.xlabel('Month')
+   plt.ylabel('Average Distance (miles)')
+   plt.title('Average Distance Traveled per Month (January 2020 - August 2024)\nTaxis and Ubers Combined')
+   plt.xticks(ticks=range(1, 13), labels=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
+   plt.legend()
+   plt.grid(visible=True)
+   if show:
+       plt.show()
+   return figure
+
+if __name__ == "__main__":
+    plot_monthly_average_distance(**read_figure_inputs(MONTHLY_DISTANCE_INPUTS))
 
 ### v3:
-combined_trips = pd.concat([taxi_data[['pickup_datetime', 'trip_distance', 'dropoff_coords']],
-                            uber_data[['pickup_datetime', 'trip_distance', 'dropoff_coords']]])
-
-start_date = '2020-01-01'
-end_date = '2024-08-31'
-combined_trips = combined_trips[(combined_trips['pickup_datetime'] >= start_date) &
-                                (combined_trips['pickup_datetime'] <= end_date)]
-
-# bounding boxes for the three major airports
-LGA_BOX_COORDS = ((40.763589, -73.891745), (40.778865, -73.854838))
-JFK_BOX_COORDS = ((40.639263, -73.795642), (40.651376, -73.766264))
-EWR_BOX_COORDS = ((40.686794, -74.194028), (40.699680, -74.165205))
-
-# if a coordinate falls within a bounding box
-def is_within_bbox(coord, bbox):
-    lat, lon = coord
-    (lat_min, lon_min), (lat_max, lon_max) = bbox
-    return lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
-
-# weekday with most popular trip
-combined_trips['weekday'] = combined_trips['pickup_datetime'].dt.day_name()
-
-def determine_airport(row):
-    coords = eval(row['dropoff_coords'].replace('POINT(', '').replace(')', ''))
-    if is_within_bbox(coords, LGA_BOX_COORDS):
-        return 'LGA'
-    elif is_within_bbox(coords, JFK_BOX_COORDS):
-        return 'JFK'
-    elif is_within_bbox(coords, EWR_BOX_COORDS):
-        return 'EWR'
-    else:
-        return None
-
-combined_trips['airport'] = combined_trips.apply(determine_airport, axis=1)
-airport_trips = combined_trips[combined_trips['airport'].isin(['LGA', 'JFK', 'EWR'])]
-airport_popularity = airport_trips.groupby(['airport', 'weekday']).size().reset_index(name='count')
-airport_popularity_pivot = airport_popularity.pivot(index='weekday', columns='airport', values='count').reindex(
-    ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# Drop-offs per zone and pickup weekday (strftime %w: 0 = Sunday), with the
+# zone centroids the airport boxes are tested against
+AIRPORT_DROPOFF_INPUTS = {"dropoff_zone_days": """
+WITH dropoffs AS (
+    SELECT dropoff_location_id, pickup_date, COUNT(*) AS trips
+    FROM taxi_trips
+    WHERE pickup_date >= '2020-01-01' AND pickup_date < '2024-09-01'
+    GROUP BY dropoff_location_id, pickup_date
+    UNION ALL
+    SELECT dropoff_location_id, pickup_date, COUNT(*) AS trips
+    FROM uber_trips
+    WHERE pickup_date >= '2020-01-01' AND pickup_date < '2024-09-01'
+    GROUP BY dropoff_location_id, pickup_date
 )
+SELECT
+    d.dropoff_location_id,
+    z.latitude,
+    z.longitude,
+    CAST(strftime('%w', d.pickup_date) AS INTEGER) AS weekday_index,
+    SUM(d.trips) AS trips
+FROM dropoffs d
+JOIN taxi_zones z ON z.location_id = d.dropoff_location_id
+GROUP BY d.dropoff_location_id, z.latitude, z.longitude, weekday_index
+"""}
+
+def plot_airport_dropoff_days(dropoff_zone_days: pd.DataFrame, show: bool = True) -> plt.Figure:
+   r"""
+   Plot drop-offs at each airport by day of the week.
+
+   Args:
+       dropoff_zone_days: Drop-off counts per zone and weekday with the zone
+           centroids, as read by AIRPORT_DROPOFF_INPUTS
+       show: Show the figure; False only draws it
 
-plt.figure(figsize=(12, 6))
-airport_popularity_pivot.plot(kind='bar', figsize=(15, 12))
-plt.xlabel('Day of the Week')
-plt.ylabel('Number of Drop-offs')
-plt.title('Most Popular Drop-off Days by Airport (January 2020 - August 2024)')
-plt.xticks(rotation=45)
-plt.legend(title='Airport')
-plt.grid(visible=True)
+   Returns:
+       plt.Figure: The drawn figure
+   """
+   weekdays = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+   dropoffs = dropoff_zone_days.assign(
+       weekday=np.array(weekdays, dtype=object)[dropoff_zone_days['weekday_index'].to_numpy()],
+       # first matching box wins: LGA, then JFK, then EWR
+       airport=classify_points(
+           dropoff_zone_days['latitude'], dropoff_zone_days['longitude'],
+           build_region_index(AIRPORT_BOX_REGIONS)
+       )
+   )
+   airport_trips = dropoffs[dropoffs['airport'].isin(['LGA', 'JFK', 'EWR'])]
+   airport_popularity = airport_trips.groupby(['airport', 'weekday'])['trips'].sum().reset_index(name='count')
+   airport_popularity_pivot = airport_popularity.pivot(index='weekday', columns='airport', values='count').reindex(
+       ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+   )
+
+   figure, ax = plt.subplots(figsize=(15, 12))
+   airport_popularity_pivot.plot(kind='bar', ax=ax)
+   ax.set_xlabel('Day of the Week')
+   ax.set_ylabel('Number of Drop-offs')
+   ax.set_title('Most Popular Drop-off Days by Airport (January 2020 - August 2024)')
+   plt.setp(ax.get_xticklabels(), rotation=45)
+   ax.legend(title='Airport')
+   ax.grid(visible=True)
+
+   plt.tight_layout()
+   if show:
+       plt.show()
+   return figure
 
-plt.tight_layout()
-plt.show()
+if __name__ == "__main__":
+    plot_airport_dropoff_days(**read_figure_inputs(AIRPORT_DROPOFF_INPUTS))
 
 ### v4
-# Database connection setup
-conn = sqlite3.connect('project.db')
-
-# Define SQL query for fare analysis
-query = """
-WITH TaxiMonthly AS (
-   SELECT 
-       strftime('%Y-%m', pickup_datetime) AS month,
-       SUM(total_amount - (COALESCE(tolls_amount, 0) + 
-                          COALESCE(mta_tax, 0) + 
-                          COALESCE(improvement_surcharge, 0) + 
-                          COALESCE(congestion_surcharge, 0) + 
-                          COALESCE(airport_fee, 0))) AS base_fares,
-       SUM(COALESCE(tolls_amount, 0)) AS tolls,
-       SUM(COALESCE(mta_tax, 0) + 
-           COALESCE(improvement_surcharge, 0) + 
-           COALESCE(congestion_surcharge, 0) + 
-           COALESCE(airport_fee, 0)) AS surcharges_and_taxes,
-       'Taxi' as service_type
-   FROM taxi_trips
-   WHERE pickup_datetime BETWEEN '2020-01-01' AND '2024-08-31'
-   GROUP BY strftime('%Y-%m', pickup_datetime)
-),
-UberMonthly AS (
-   SELECT 
-       strftime('%Y-%m', pickup_datetime) AS month,
-       SUM(base_passenger_fare) AS base_fares,
-       SUM(COALESCE(tolls, 0)) AS tolls,
-       SUM(COALESCE(sales_tax, 0) + 
-           COALESCE(congestion_surcharge, 0) + 
-           COALESCE(airport_fee, 0) + 
-           COALESCE(bcf, 0)) AS surcharges_and_taxes,
-       'Uber' as service_type
-   FROM uber_trips
-   WHERE pickup_datetime BETWEEN '2020-01-01' AND '2024-08-31'
-   GROUP BY strftime('%Y-%m', pickup_datetime)
-)
-SELECT * FROM TaxiMonthly
-UNION ALL
-SELECT * FROM UberMonthly
+# Define SQL query for fare analysis, read from the monthly sums in trip_rollups
+MONTHLY_FARES_QUERY = """
+SELECT 
+   pickup_month AS month,
+   SUM(base_fares) AS base_fares,
+   SUM(tolls) AS tolls,
+   SUM(surcharges_and_taxes) AS surcharges_and_taxes,
+   CASE service WHEN 'taxi' THEN 'Taxi' ELSE 'Uber' END AS service_type
+FROM trip_rollups
+WHERE pickup_month BETWEEN '2020-01' AND '2024-08'
+GROUP BY pickup_month, service
 ORDER BY month, service_type;
 """
 
-# Execute query and process data
-monthly_fares = pd.read_sql(query, conn)
-conn.close()
-
-# Data preprocessing
-monthly_fares['month'] = pd.to_datetime(monthly_fares['month'] + '-01')
+MONTHLY_FARES_INPUTS = {"monthly_fares": MONTHLY_FARES_QUERY}
 
 # Create visualization
-def create_fare_breakdown_plots():
+def create_fare_breakdown_plots(monthly_fares: pd.DataFrame, show: bool = True) -> plt.Figure:
    """Create stacked bar plots showing fare breakdowns for Taxi and Uber services."""
+   # Data preprocessing
+   monthly_fares = monthly_fares.assign(month=pd.to_datetime(monthly_fares['month'] + '-01'))
+
    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 12))
    
    # Plot configurations
@@ -226,7 +263,9 @@ def create_fare_breakdown_plots():
    # Format axes and layout
    _format_axes([ax1, ax2])
    plt.tight_layout()
-   plt.show()
+   if show:
+       plt.show()
+   return fig
 
 def _create_stacked_bars(ax, data, colors, params, service_type):
    """Create stacked bar chart for given service type."""
@@ -278,73 +317,299 @@ def _format_axes(axes):
            ax.set_xlabel('Month', fontsize=12)
 
 # Generate plots
-create_fare_breakdown_plots()
+if __name__ == "__main__":
+    create_fare_breakdown_plots(**read_figure_inputs(MONTHLY_FARES_INPUTS))
 
 ###v5:
-taxi_data['hour'] = taxi_data['pickup_datetime'].dt.round('H')
-uber_data['hour'] = uber_data['pickup_datetime'].dt.round('H')
-hourly_weather_data['hour'] = hourly_weather_data['date'].dt.round('H')
-
-taxi_merged = pd.merge(taxi_data, hourly_weather_data[['hour', 'hourly precipitation']], on='hour', how='left')
-uber_merged = pd.merge(uber_data, hourly_weather_data[['hour', 'hourly precipitation']], on='hour', how='left')
-
-# removing any negative or zero distances
-taxi_merged = taxi_merged[(taxi_merged['trip_distance'] > 0) & (taxi_merged['tip_amount'] > 0)]
-uber_merged = uber_merged[(uber_merged['trip_distance'] > 0) & (uber_merged['tips'] > 0)]
-
-# removing extremely large
-taxi_merged = taxi_merged[
-    (taxi_merged['trip_distance'] < np.percentile(taxi_merged['trip_distance'], 99)) &
-    (taxi_merged['tip_amount'] < np.percentile(taxi_merged['tip_amount'], 99))
-]
-
-uber_merged = uber_merged[
-    (uber_merged['trip_distance'] < np.percentile(uber_merged['trip_distance'], 99)) &
-    (uber_merged['tips'] < np.percentile(uber_merged['tips'], 99))
-]
-
-# Plotting
-fig, axes = plt.subplots(2, 2, figsize=(15, 10))
-
-# Taxi tips vs. distance
-axes[0, 0].scatter(taxi_merged['trip_distance'], taxi_merged['tip_amount'], alpha=0.5, color='blue')
-axes[0, 0].set_xlabel('Distance (miles)')
-axes[0, 0].set_ylabel('Tip Amount ($)')
-axes[0, 0].set_title('Yellow Taxi Tips vs. Distance')
-
-# Uber tips vs. distance
-axes[0, 1].scatter(uber_merged['trip_distance'], uber_merged['tips'], alpha=0.5, color='red')
-axes[0, 1].set_xlabel('Distance (miles)')
-axes[0, 1].set_ylabel('Tip Amount ($)')
-axes[0, 1].set_title('Uber Tips vs. Distance')
-
-# Taxi tips vs. precipitation
-axes[1, 0].scatter(taxi_merged['hourly precipitation'], taxi_merged['tip_amount'], alpha=0.5, color='green')
-axes[1, 0].set_xlabel('Hourly Precipitation (inches)')
-axes[1, 0].set_ylabel('Tip Amount ($)')
-axes[1, 0].set_title('Yellow Taxi Tips vs. Precipitation')
-
-# Uber tips vs. precipitation
-axes[1, 1].scatter(uber_merged['hourly precipitation'], uber_merged['tips'], alpha=0.5, color='purple')
-axes[1, 1].set_xlabel('Hourly Precipitation (inches)')
-axes[1, 1].set_ylabel('Tip Amount ($)')
-axes[1, 1].set_title('Uber Tips vs. Precipitation')
-
-plt.tight_layout()
-plt.show()
+# Trips with a positive distance and tip, and the hourly precipitation they
+# are matched with; v5 refers to Uber's trip_miles as trip_distance
+TIPS_INPUTS = {
+    "taxi_tips": """
+    SELECT pickup_datetime, trip_distance, tip_amount
+    FROM taxi_trips
+    WHERE trip_distance > 0 AND tip_amount > 0
+    """,
+    "uber_tips": """
+    SELECT pickup_datetime, trip_miles AS trip_distance, tips
+    FROM uber_trips
+    WHERE trip_miles > 0 AND tips > 0
+    """,
+    "hourly_weather": """
+    SELECT date, hourly_precipitation AS "hourly precipitation"
+    FROM hourly_weather
+    """
+}
+
+def plot_tips_vs_distance_and_precipitation(
+    taxi_tips: pd.DataFrame,
+    uber_tips: pd.DataFrame,
+    hourly_weather: pd.DataFrame,
+    show: bool = True
+) -> plt.Figure:
+   r"""
+   Scatter tips against trip distance and hourly precipitation for both services.
+
+   Args:
+       taxi_tips: Taxi trips with pickup_datetime, trip_distance and tip_amount
+       uber_tips: Uber trips with pickup_datetime, trip_distance and tips
+       hourly_weather: Hourly weather with date and 'hourly precipitation'
+       show: Show the figure; False only draws it
+
+   Returns:
+       plt.Figure: The drawn figure
+   """
+   # weather of each pickup's nearest hour, one row per hour (see build_hourly_weather_index)
+   hourly_weather_index = build_hourly_weather_index(hourly_weather, columns=['hourly precipitation'])
+   taxi_merged = attach_hourly_weather(taxi_tips, hourly_weather_index)
+   uber_merged = attach_hourly_weather(uber_tips, hourly_weather_index)
+
+   # removing extremely large
+   taxi_merged = taxi_merged[
+       (taxi_merged['trip_distance'] < np.percentile(taxi_merged['trip_distance'], 99)) &
+       (taxi_merged['tip_amount'] < np.percentile(taxi_merged['tip_amount'], 99))
+   ]
+
+   uber_merged = uber_merged[
+       (uber_merged['trip_distance'] < np.percentile(uber_merged['trip_distance'], 99)) &
+       (uber_merged['tips'] < np.percentile(uber_merged['tips'], 99))
+   ]
+
+   # Plotting
+   fig, axes = plt.subplots(2, 2, figsize=(15, 10))
+
+   # Taxi tips vs. distance
+   axes[0, 0].scatter(taxi_merged['trip_distance'], taxi_merged['tip_amount'], alpha=0.5, color='blue')
+   axes[0, 0].set_xlabel('Distance (miles)')
+   axes[0, 0].set_ylabel('Tip Amount ($)')
+   axes[0, 0].set_title('Yellow Taxi Tips vs. Distance')
+
+   # Uber tips vs. distance
+   axes[0, 1].scatter(uber_merged['trip_distance'], uber_merged['tips'], alpha=0.5, color='red')
+   axes[0, 1].set_xlabel('Distance (miles)')
+   axes[0, 1].set_ylabel('Tip Amount ($)')
+   axes[0, 1].set_title('Uber Tips vs. Distance')
+
+   # Taxi tips vs. precipitation
+   axes[1, 0].scatter(taxi_merged['hourly precipitation'], taxi_merged['tip_amount'], alpha=0.5, color='green')
+   axes[1, 0].set_xlabel('Hourly Precipitation (inches)')
+   axes[1, 0].set_ylabel('Tip Amount ($)')
+   axes[1, 0].set_title('Yellow Taxi Tips vs. Precipitation')
+
+   # Uber tips vs. precipitation
+   axes[1, 1].scatter(uber_merged['hourly precipitation'], uber_merged['tips'], alpha=0.5, color='purple')
+   axes[1, 1].set_xlabel('Hourly Precipitation (inches)')
+   axes[1, 1].set_ylabel('Tip Amount ($)')
+   axes[1, 1].set_title('Uber Tips vs. Precipitation')
+
+   plt.tight_layout()
+   if show:
+       plt.show()
+   return fig
+
+if __name__ == "__main__":
+    plot_tips_vs_distance_and_precipitation(**read_figure_inputs(TIPS_INPUTS))
 
 ### v6:
-m = folium.Map(location=[40.7128, -74.0060], zoom_start=11)
+def zone_heatmap_points(zone_counts: pd.DataFrame) -> list[list[float]]:
+   r"""
+   Turn zone trip counts into weighted HeatMap points.
+
+   Args:
+       zone_counts: Result of query_zone_trip_counts
+
+   Returns:
+       list: [latitude, longitude, weight] per zone, with weights scaled so
+           the busiest zone has weight 1
+   """
+   weights = zone_counts['trips'] / max(zone_counts['trips'].max(), 1)
+   return np.column_stack([zone_counts['latitude'], zone_counts['longitude'], weights]).tolist()
+
+def load_zone_trip_counts(use_cache: bool = True, **params) -> pd.DataFrame:
+   """Read query_zone_trip_counts for params, cached for the current data version."""
+   conn = connect_read_only()
+   try:
+       return run_compute(query_zone_trip_counts, conn, params, read_data_version(conn), use_cache)
+   finally:
+       conn.close()
+
+def save_zone_heatmap(
+    output: str = "nyc_rides_heatmap_2020.html",
+    use_cache: bool = True,
+    start_month: str | None = None,
+    end_month: str | None = None
+) -> str:
+   r"""
+   Draw the taxi and Uber pickup zones as heat map layers of a folium map.
+
+   Args:
+       output: HTML file to write
+       use_cache: Reuse zone counts cached for the current data version
+       start_month: First pickup month drawn ("YYYY-MM"); None starts at the
+           first loaded month
+       end_month: Last pickup month drawn ("YYYY-MM"); None ends at the last
+           loaded month
+
+   Returns:
+       str: output
+   """
+   import folium
+   from folium.plugins import HeatMap
+
+   m = folium.Map(location=[40.7128, -74.0060], zoom_start=11)
+
+   # only use pickup time since that is conclusiove; one weighted point per
+   # pickup zone keeps the HTML small for any date range
+   taxi_zone_counts = load_zone_trip_counts(
+       use_cache, start_month=start_month, end_month=end_month, services=("taxi",), trip_end="pickup"
+   )
+   HeatMap(zone_heatmap_points(taxi_zone_counts), radius=15, gradient={0.4: 'yellow', 0.65: 'orange', 1: 'red'}).add_to(m)
+
+   uber_zone_counts = load_zone_trip_counts(
+       use_cache, start_month=start_month, end_month=end_month, services=("uber",), trip_end="pickup"
+   )
+   HeatMap(zone_heatmap_points(uber_zone_counts), radius=15, gradient={0.4: 'blue', 0.65: 'purple', 1: 'red'}).add_to(m)
+
+   m.save(output)
+   return output
+
+if __name__ == "__main__":
+    save_zone_heatmap()
+
+### Report
+REPORT_DIRECTORY = "report"
+REPORT_FORMATS = ("png", "svg")
+REPORT_WORKERS = 4  # worker processes drawing figures
+REPORT_HASHES_FILE = os.path.join(REPORT_DIRECTORY, "figure_hashes.json")
+
+# Figures written by render_report: plot function (taking show=False) and
+# the queries its arguments are read with
+REPORT_FIGURES = {
+    "hourly_taxi_distribution": {"plot": plot_hourly_taxi_distribution, "inputs": HOURLY_TAXI_INPUTS},
+    "monthly_average_distance": {"plot": plot_monthly_average_distance, "inputs": MONTHLY_DISTANCE_INPUTS},
+    "airport_dropoff_days": {"plot": plot_airport_dropoff_days, "inputs": AIRPORT_DROPOFF_INPUTS},
+    "fare_breakdown": {"plot": create_fare_breakdown_plots, "inputs": MONTHLY_FARES_INPUTS},
+    "tips_vs_distance_and_precipitation": {
+        "plot": plot_tips_vs_distance_and_precipitation, "inputs": TIPS_INPUTS
+    }
+}
+
+def figure_input_hash(name: str, inputs: dict[str, pd.DataFrame]) -> str:
+   """Hash a figure's name and the contents of its input DataFrames."""
+   digest = hashlib.sha256(name.encode())
+   for argument in sorted(inputs):
+       df = inputs[argument]
+       digest.update(f"\0{argument}\0{list(df.columns)}\0".encode())
+       digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+   return digest.hexdigest()
+
+def render_figure(
+    name: str,
+    inputs: dict[str, pd.DataFrame],
+    directory: str = REPORT_DIRECTORY,
+    formats: tuple[str, ...] = REPORT_FORMATS
+) -> list[str]:
+   r"""
+   Draw one report figure and save it in every format.
+
+   Args:
+       name: Key of REPORT_FIGURES
+       inputs: Arguments of the figure's plot function
+       directory: Directory the files are written to
+       formats: File extensions to save, e.g. "png" and "svg"
+
+   Returns:
+       list: Paths of the written files
+   """
+   figure = REPORT_FIGURES[name]["plot"](**inputs, show=False)
+   try:
+       paths = []
+       for file_format in formats:
+           path = os.path.join(directory, f"{name}.{file_format}")
+           figure.savefig(path, format=file_format)
+           paths.append(path)
+       return paths
+   finally:
+       plt.close(figure)
+
+def render_report(
+    names: list[str] | None = None,
+    directory: str = REPORT_DIRECTORY,
+    formats: tuple[str, ...] = REPORT_FORMATS,
+    workers: int = REPORT_WORKERS,
+    force: bool = False
+) -> dict[str, list[str]]:
+   r"""
+   Render report figures to files, skipping those whose inputs have not changed.
 
-# only use pickup time since that is conclusiove
-# taxi data
-taxi_coords = [[float(coord.split(',')[0]), float(coord.split(',')[1])] 
-               for coord in taxi_data['pickup_coords']]
-HeatMap(taxi_coords, radius=15, gradient={0.4: 'yellow', 0.65: 'orange', 1: 'red'}).add_to(m)
+   Args:
+       names: Keys of REPORT_FIGURES to render (default all)
+       directory: Directory the files are written to
+       formats: File extensions to save
+       workers: Number of worker processes; 1 draws in this process
+       force: Redraw every figure even if its inputs are unchanged
 
-# uber data
-uber_coords = [[float(coord.split(',')[0]), float(coord.split(',')[1])] 
-               for coord in uber_data['pickup_coords']]
-HeatMap(uber_coords, radius=15, gradient={0.4: 'blue', 0.65: 'purple', 1: 'red'}).add_to(m)
+   Returns:
+       dict: Figures that were "rendered", "skipped" as unchanged, or "failed"
 
-m.save('nyc_rides_heatmap_2020.html')
+   Notes:
+       - Inputs are read here, cached per data version (see
+         read_figure_inputs); the workers only draw
+       - A figure is skipped when figure_input_hash matches the hash stored
+         in REPORT_HASHES_FILE at its last render and all its files exist.
+         Changes to a plot function are not detected; use force
+       - Workers draw with the Agg backend, so no display is needed
+   """
+   names = list(REPORT_FIGURES) if names is None else names
+   os.makedirs(directory, exist_ok=True)
+   hashes_file = os.path.join(directory, os.path.basename(REPORT_HASHES_FILE))
+   stored_hashes = {}
+   if os.path.exists(hashes_file):
+       with open(hashes_file) as f:
+           stored_hashes = json.load(f)
+
+   summary = {"rendered": [], "skipped": [], "failed": []}
+   figure_inputs = {}
+   input_hashes = {}
+   for name in names:
+       figure_inputs[name] = read_figure_inputs(REPORT_FIGURES[name]["inputs"])
+       input_hashes[name] = figure_input_hash(name, figure_inputs[name])
+       files_exist = all(
+           os.path.exists(os.path.join(directory, f"{name}.{file_format}")) for file_format in formats
+       )
+       if not force and files_exist and stored_hashes.get(name) == input_hashes[name]:
+           summary["skipped"].append(name)
+           del figure_inputs[name]
+
+   def record(name: str, render) -> None:
+       try:
+           render()
+       except Exception as e:
+           print(f"Error rendering {name}: {e}")
+           stored_hashes.pop(name, None)
+           summary["failed"].append(name)
+       else:
+           stored_hashes[name] = input_hashes[name]
+           summary["rendered"].append(name)
+
+   if workers <= 1 or len(figure_inputs) <= 1:
+       for name, inputs in figure_inputs.items():
+           record(name, partial(render_figure, name, inputs, directory, formats))
+   else:
+       with ProcessPoolExecutor(
+           max_workers=workers, initializer=plt.switch_backend, initargs=("Agg",)
+       ) as executor:
+           futures = {
+               name: executor.submit(render_figure, name, inputs, directory, formats)
+               for name, inputs in figure_inputs.items()
+           }
+           for name, future in futures.items():
+               record(name, future.result)
+
+   with open(f"{hashes_file}.tmp", "w") as f:
+       json.dump(stored_hashes, f, indent=2, sort_keys=True)
+   os.replace(f"{hashes_file}.tmp", hashes_file)
+   return summary
+
+# Notebook run only; cli.py render draws the report from the command line
+if __name__ == "__main__":
+    report_summary = render_report()
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import cli
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch) -> str:
+   """Run the test in an empty directory, since the parts use relative paths for data/."""
+   monkeypatch.chdir(tmp_path)
+   return str(tmp_path)
+
+@pytest.fixture
+def parts(workdir) -> dict:
+   r"""
+   Namespace of all four parts, loaded in workdir.
+
+   The database engine resolves project.db when the parts are loaded, so
+   each test loads them again in its own directory.
+   """
+   return cli.load_parts(len(cli.PART_FILES), REPOSITORY_ROOT, module_name="tests._parts")
+
+@pytest.fixture
+def taxi_zones(parts, workdir, monkeypatch) -> str:
+   """Synthetic taxi zone shapefile, set as the parts' TAXI_ZONES_SHAPEFILE."""
+   from benchmarks.synthetic import write_taxi_zones
+
+   shapefile = write_taxi_zones(os.path.join(workdir, "taxi_zones"))
+   monkeypatch.setitem(parts, "TAXI_ZONES_SHAPEFILE", shapefile)
+   return shapefile
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_taxi_month, write_taxi_zones, write_uber_month
+
+@pytest.fixture
+def trip_months(parts, workdir, monkeypatch) -> list[str]:
+   """Three small taxi months of several row groups each, with their taxi zones."""
+   monkeypatch.setitem(parts, "TAXI_ZONES_SHAPEFILE", write_taxi_zones(os.path.join(workdir, "taxi_zones")))
+   return [
+       write_taxi_month(
+           os.path.join(workdir, f"yellow_tripdata_2024-{month:02d}.parquet"),
+           2024, month, 3000, seed=month, row_group_size=500
+       )
+       for month in (1, 2, 3)
+   ]
+
+def test_clean_months_does_not_depend_on_workers(parts, trip_months):
+   serial = parts["clean_months"](parts["get_and_clean_taxi_month"], trip_months, workers=1)
+   parallel = parts["clean_months"](
+       parts["get_and_clean_taxi_month"], trip_months, workers=2, max_months_in_memory=1
+   )
+
+   assert all(df is not None for df in serial)
+   for serial_month, parallel_month in zip(serial, parallel):
+       pd.testing.assert_frame_equal(serial_month, parallel_month)
+
+def test_sample_parquet_rows_is_reproducible(parts, workdir):
+   path = write_uber_month(
+       os.path.join(workdir, "fhvhv_tripdata_2024-01.parquet"), 2024, 1, 5000, row_group_size=700
+   )
+   columns = ["hvfhs_license_num", "pickup_datetime", "trip_miles"]
+   filters = [("hvfhs_license_num", "==", "HV0003"), ("trip_miles", ">", 1.0)]
+
+   sample = parts["sample_parquet_rows"](path, columns, filters, random_state=7)
+   pd.testing.assert_frame_equal(sample, parts["sample_parquet_rows"](path, columns, filters, random_state=7))
+   assert not sample.index.equals(parts["sample_parquet_rows"](path, columns, filters, random_state=8).index)
+
+   # The index is the row's position among the matching rows of the file
+   matching = parts["read_tlc_parquet"](path, columns, filters)
+   assert 0 < len(sample) < len(matching)
+   pd.testing.assert_frame_equal(
+       sample.reset_index(drop=True), matching.iloc[sample.index].reset_index(drop=True)
+   )
+
+def test_trip_without_dropoff_is_cleaned_but_not_stored(parts, workdir, taxi_zones):
+   path = write_taxi_month(os.path.join(workdir, "yellow_tripdata_2024-01.parquet"), 2024, 1, 500)
+   trips = pd.read_parquet(path)
+   trips.loc[0, "tpep_dropoff_datetime"] = pd.NaT
+   trips.to_parquet(path)
+
+   cleaned = parts["clean_trip_month"](path, "taxi", sample=False)
+
+   assert cleaned is not None
+   assert len(cleaned) == 500
+   assert cleaned["weekday_num"].dtype == "Int8"
+   assert cleaned["weekday_num"].isna().sum() == 1
+
+   # The database has no weekday for it, so only that trip is left out
+   def stored_trips():
+       conn = sqlite3.connect("project.db")
+       try:
+           return conn.execute("SELECT COUNT(*), (SELECT SUM(trips) FROM trip_rollups) FROM taxi_trips").fetchone()
+       finally:
+           conn.close()
+
+   parts["write_dataframes_to_table"]({"taxi_trips": cleaned})
+   assert stored_trips() == (499, 499)
+   parts["write_dataframes_to_table"]({"taxi_trips": cleaned}, bulk=True)
+   assert stored_trips() == (998, 998)
+   parts["replace_source_period"](
+       {"taxi_trips": cleaned}, "yellow_tripdata_2024-01.parquet", "0" * 64, "2024-01", ("2024-01-01", "2024-02-01")
+   )
+   assert stored_trips() == (499, 499)
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+
+from benchmarks.synthetic import write_weather_csv
+
+# Trip tables as created before LocationIDs replaced the coordinate strings
+OLD_TRIP_SCHEMAS = [
+   """
+   CREATE TABLE taxi_trips (
+      pickup_datetime TIMESTAMP NOT NULL, dropoff_datetime TIMESTAMP NOT NULL,
+      rate_code_id FLOAT, trip_distance FLOAT NOT NULL, extra FLOAT, mta_tax FLOAT,
+      tip_amount FLOAT, tolls_amount FLOAT, improvement_surcharge FLOAT,
+      total_amount FLOAT, congestion_surcharge FLOAT, airport_fee FLOAT,
+      pickup_coords VARCHAR(50), dropoff_coords VARCHAR(50),
+      weekday_num INTEGER NOT NULL, airport VARCHAR(50)
+   )
+   """,
+   """
+   CREATE TABLE uber_trips (
+      hvfhs_license_num VARCHAR(50) NOT NULL, pickup_datetime TIMESTAMP NOT NULL,
+      dropoff_datetime TIMESTAMP NOT NULL, trip_miles FLOAT, base_passenger_fare FLOAT,
+      tolls FLOAT, sales_tax FLOAT, congestion_surcharge FLOAT, airport_fee FLOAT,
+      driver_pay FLOAT, bcf FLOAT, pickup_coords VARCHAR(50), dropoff_coords VARCHAR(50),
+      weekday_num INTEGER NOT NULL, total_amount FLOAT, airport VARCHAR(50)
+   )
+   """
+]
+
+def test_bulk_load_restores_journal_mode(parts, workdir, taxi_zones):
+   hourly_weather, daily_weather = parts["clean_weather_file"](
+       write_weather_csv(os.path.join(workdir, "2024_weather.csv"), 2024)
+   )
+
+   parts["write_dataframes_to_table"](
+       {"hourly_weather": hourly_weather, "daily_weather": daily_weather}, bulk=True
+   )
+
+   conn = sqlite3.connect("project.db")
+   try:
+       assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+       assert conn.execute("SELECT COUNT(*) FROM hourly_weather").fetchone()[0] == len(hourly_weather)
+   finally:
+       conn.close()
+   assert not os.path.exists("project.db-wal")
+
+def test_location_ids_backfilled_within_tolerance(parts, workdir, taxi_zones, capsys):
+   centroids = parts["get_zone_centroid_index"]()
+   # Centroids from another GEOS build differ in the last digits
+   pickup = [f"{lat + 1e-7},{lon - 1e-7}" for lat, lon in centroids[[1, 2, 3]]]
+   dropoff = [f"{centroids[4][0]},{centroids[4][1]}", f"{centroids[5][0]:.6f},{centroids[5][1]:.6f}", "40.0,-80.0"]
+   conn = sqlite3.connect("project.db")
+   try:
+       for schema in OLD_TRIP_SCHEMAS:
+           conn.execute(schema)
+       conn.executemany(
+           "INSERT INTO taxi_trips (pickup_datetime, dropoff_datetime, trip_distance, "
+           "pickup_coords, dropoff_coords, weekday_num) VALUES (?, ?, 1.0, ?, ?, 1)",
+           [("2024-01-01 10:00:00", "2024-01-01 10:20:00", p, d) for p, d in zip(pickup, dropoff)]
+       )
+       conn.commit()
+   finally:
+       conn.close()
+
+   parts["create_database_tables"]()
+
+   conn = sqlite3.connect("project.db")
+   try:
+       location_ids = conn.execute(
+           "SELECT pickup_location_id, dropoff_location_id FROM taxi_trips ORDER BY rowid"
+       ).fetchall()
+   finally:
+       conn.close()
+   assert location_ids == [(1, 4), (2, 5), (3, None)]
+   assert "1 rows of taxi_trips have a dropoff_coords more than" in capsys.readouterr().out
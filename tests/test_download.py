@@ -0,0 +1,84 @@
+import gzip
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+class GzipRequestHandler(SimpleHTTPRequestHandler):
+   """Serve every file gzip-encoded, whatever Accept-Encoding the client sent."""
+
+   def do_GET(self):
+       path = self.translate_path(self.path)
+       if not os.path.isfile(path):
+           self.send_error(404)
+           return
+       with open(path, "rb") as f:
+           body = gzip.compress(f.read())
+       self.send_response(200)
+       self.send_header("Content-Type", "text/csv")
+       self.send_header("Content-Encoding", "gzip")
+       self.send_header("Content-Length", str(len(body)))
+       self.end_headers()
+       self.wfile.write(body)
+
+def serve_gzip_directory(directory: str) -> tuple[ThreadingHTTPServer, str]:
+   """serve_directory, with every response gzip-encoded."""
+   server = ThreadingHTTPServer(("127.0.0.1", 0), partial(GzipRequestHandler, directory=directory))
+   threading.Thread(target=server.serve_forever, daemon=True).start()
+   return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+@pytest.fixture
+def source_directory(tmp_path) -> str:
+   directory = tmp_path / "source"
+   directory.mkdir()
+   # Compressible, like the weather CSVs, so the gzip body is much smaller
+   rows = "\n".join(f"2024-01-01T{hour:02d}:51:00,{hour},0.00,12" for hour in range(24))
+   (directory / "2024_weather.csv").write_text(("DATE,HOUR,PRCP,WIND\n" + rows + "\n") * 100)
+   return str(directory)
+
+def test_fetch_gzip_encoded_download(parts, workdir, source_directory):
+   server, base_url = serve_gzip_directory(source_directory)
+   try:
+       local_path = parts["fetch_source_file"](base_url + "2024_weather.csv", offline=False)
+   finally:
+       server.shutdown()
+
+   with open(os.path.join(source_directory, "2024_weather.csv"), "rb") as f:
+       source = f.read()
+   with open(local_path, "rb") as f:
+       assert f.read() == source
+   entry = parts["load_manifest"]()["files"]["2024_weather.csv"]
+   assert entry["size"] == len(source)
+   assert entry["sha256"] == parts["file_sha256"](local_path)
+
+def test_fetch_revalidates_cached_file(parts, workdir, source_directory, monkeypatch):
+   source_path = os.path.join(source_directory, "2024_weather.csv")
+   server, base_url = parts["serve_directory"](source_directory)
+   url = base_url + "2024_weather.csv"
+   try:
+       local_path = parts["fetch_source_file"](url, offline=False)
+       fetched_at = parts["load_manifest"]()["files"]["2024_weather.csv"]["fetched_at"]
+
+       # Unchanged upstream and locally: neither downloaded nor hashed again
+       def no_hashing(path):
+           raise AssertionError(f"{path} was hashed again")
+
+       with monkeypatch.context() as patch:
+           patch.setitem(parts, "file_sha256", no_hashing)
+           assert parts["fetch_source_file"](url, offline=False) == local_path
+       assert parts["load_manifest"]()["files"]["2024_weather.csv"]["fetched_at"] == fetched_at
+
+       # A correction upstream is downloaded
+       with open(source_path, "a") as f:
+           f.write("2024-01-02T00:51:00,0,0.10,8\n")
+       modified = os.path.getmtime(source_path) + 60
+       os.utime(source_path, (modified, modified))
+       parts["fetch_source_file"](url, offline=False)
+   finally:
+       server.shutdown()
+
+   with open(source_path, "rb") as source, open(local_path, "rb") as f:
+       assert f.read() == source.read()
+   assert parts["load_manifest"]()["files"]["2024_weather.csv"]["fetched_at"] != fetched_at
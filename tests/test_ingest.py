@@ -0,0 +1,60 @@
+import os
+import shutil
+import sqlite3
+
+import pandas as pd
+
+from benchmarks.synthetic import generate_dataset, write_weather_csv
+
+def test_ingest_picks_up_new_month(parts, workdir, monkeypatch):
+   dataset = generate_dataset(os.path.join(workdir, "source"), ["2024-01", "2024-02"], 2000)
+   monkeypatch.setitem(parts, "TAXI_ZONES_SHAPEFILE", dataset["taxi_zones"])
+   monkeypatch.setitem(parts, "WEATHER_CSV_DIR", os.path.dirname(dataset["weather"][0]))
+
+   # The TLC page stand-in lists only January at first
+   site = os.path.join(workdir, "site")
+   os.makedirs(site)
+   for path in (dataset["taxi"][0], dataset["uber"][0]):
+       shutil.copy(path, site)
+   server, tlc_url = parts["serve_directory"](site)
+   try:
+       first = parts["ingest_all_sources"](tlc_url=tlc_url)
+       for path in (dataset["taxi"][1], dataset["uber"][1]):
+           shutil.copy(path, site)
+       second = parts["ingest_all_sources"](tlc_url=tlc_url)
+   finally:
+       server.shutdown()
+
+   assert first["taxi_trips"]["ingested"] == ["yellow_tripdata_2024-01.parquet"]
+   assert second["taxi_trips"]["ingested"] == ["yellow_tripdata_2024-02.parquet"]
+   assert second["taxi_trips"]["skipped"] == ["yellow_tripdata_2024-01.parquet"]
+   assert second["uber_trips"]["ingested"] == ["fhvhv_tripdata_2024-02.parquet"]
+   assert second["uber_trips"]["skipped"] == ["fhvhv_tripdata_2024-01.parquet"]
+
+def test_ingest_reloads_changed_weather_file(parts, workdir, taxi_zones):
+   site = os.path.join(workdir, "site")
+   os.makedirs(site)
+   source_path = write_weather_csv(os.path.join(site, "2024_weather.csv"), 2024, seed=1)
+   server, base_url = parts["serve_directory"](site)
+   url = base_url + "2024_weather.csv"
+   try:
+       first = parts["ingest_weather_files"]([url])
+       write_weather_csv(source_path, 2024, seed=2)
+       modified = os.path.getmtime(source_path) + 60
+       os.utime(source_path, (modified, modified))
+       second = parts["ingest_weather_files"]([url])
+       third = parts["ingest_weather_files"]([url])
+   finally:
+       server.shutdown()
+
+   assert first["ingested"] == second["ingested"] == third["skipped"] == ["2024_weather.csv"]
+   expected, _ = parts["clean_weather_file"](source_path, refresh=True)
+   conn = sqlite3.connect("project.db")
+   try:
+       stored = pd.read_sql_query(
+           "SELECT COUNT(*) AS hours, SUM(hourly_temperature) AS temperature FROM hourly_weather", conn
+       )
+   finally:
+       conn.close()
+   assert stored["hours"][0] == len(expected)
+   assert abs(stored["temperature"][0] - expected["hourly temperature"].astype(float).sum()) < 1e-6 * len(expected)
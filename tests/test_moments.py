@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+def test_merged_moments_equal_direct_moments(parts):
+   rng = np.random.default_rng(5)
+   values = rng.gamma(2, 1.5, 10_000) + 1e6  # large offset, where sums of squares lose precision
+
+   merged = parts["merge_moments"](
+       [parts["compute_moments"](part) for part in np.array_split(values, 13)] + [parts["compute_moments"]([])]
+   )
+
+   assert merged["count"] == len(values)
+   assert np.isclose(merged["mean"], values.mean(), rtol=1e-12)
+   assert np.isclose(np.sqrt(merged["m2"] / (merged["count"] - 1)), values.std(ddof=1), rtol=1e-9)
+
+def test_combined_distance_moments_match_groupby(parts):
+   rng = np.random.default_rng(6)
+   trips = pd.DataFrame({
+       "service": rng.choice(["taxi", "uber"], 20_000),
+       "pickup_month": rng.choice(["2024-01", "2024-02", "2024-03"], 20_000),
+       "distance": rng.lognormal(1, 0.7, 20_000)
+   })
+   # One distance_moments row per service and month, as the database keeps them
+   rows = []
+   for (service, month), distances in trips.groupby(["service", "pickup_month"])["distance"]:
+       moments = parts["compute_moments"](distances)
+       rows.append({
+           "service": service, "pickup_month": month, "trips": moments["count"],
+           "mean_distance": moments["mean"], "m2_distance": moments["m2"]
+       })
+   rows.append({"service": "taxi", "pickup_month": "2024-04", "trips": 0, "mean_distance": 0.0, "m2_distance": 0.0})
+
+   combined = parts["combine_distance_moments"](pd.DataFrame(rows), "service").set_index("service")
+   expected = trips.groupby("service")["distance"].agg(["count", "mean", "std"])
+
+   assert combined["count"].tolist() == expected["count"].tolist()
+   np.testing.assert_allclose(combined["mean"], expected["mean"], rtol=1e-12)
+   np.testing.assert_allclose(combined["std"], expected["std"], rtol=1e-12)
@@ -0,0 +1,30 @@
+import os
+import sqlite3
+
+from benchmarks.synthetic import write_taxi_month
+
+def test_zone_trip_counts_default_to_every_loaded_month(parts, workdir, taxi_zones):
+   source = os.path.join(workdir, "source")
+   os.makedirs(source)
+   paths = [
+       write_taxi_month(os.path.join(source, f"yellow_tripdata_2024-{month:02d}.parquet"), 2024, month, 1000, seed=month)
+       for month in (8, 9)
+   ]
+   summary = parts["ingest_trip_months"]("taxi_trips", paths, workers=1)
+   assert len(summary["ingested"]) == 2
+
+   conn = sqlite3.connect("project.db")
+   try:
+       months = parts["query_zone_trip_counts"](conn, services=("taxi",))
+       august = parts["query_zone_trip_counts"](conn, end_month="2024-08", services=("taxi",))
+       september = parts["query_zone_trip_counts"](conn, start_month="2024-09", services=("taxi",))
+       loaded = conn.execute("SELECT COUNT(*) FROM taxi_trips WHERE pickup_location_id IS NOT NULL").fetchone()[0]
+   finally:
+       conn.close()
+
+   assert months["trips"].sum() == loaded
+   assert 0 < august["trips"].sum() < loaded
+   assert august["trips"].sum() + september["trips"].sum() == loaded
+
+   output = parts["save_zone_heatmap"](os.path.join(workdir, "heatmap.html"), start_month="2024-09")
+   assert os.path.getsize(output) > 0
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+def is_within_bbox(coord, bbox):
+   """The original per-point check of the airport analysis."""
+   lat, lon = coord
+   (lat_min, lon_min), (lat_max, lon_max) = bbox
+   return lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
+
+def classify_by_loop(lats, lons, regions: dict) -> list:
+   """First region each point falls in, checked box by box."""
+   return [
+       next((name for name, bbox in regions.items() if is_within_bbox((lat, lon), bbox)), None)
+       for lat, lon in zip(lats, lons)
+   ]
+
+def edge_points(regions: dict) -> tuple[np.ndarray, np.ndarray]:
+   """Corners, edge midpoints and points just outside the edges of every box."""
+   lats, lons = [], []
+   for (lat_min, lon_min), (lat_max, lon_max) in regions.values():
+       for lat in (lat_min, (lat_min + lat_max) / 2, lat_max):
+           for lon in (lon_min, (lon_min + lon_max) / 2, lon_max):
+               lats.append(lat)
+               lons.append(lon)
+       for lat, lon in [
+           (np.nextafter(lat_min, -np.inf), lon_min), (np.nextafter(lat_max, np.inf), lon_max),
+           (lat_min, np.nextafter(lon_min, -np.inf)), (lat_max, np.nextafter(lon_max, np.inf))
+       ]:
+           lats.append(lat)
+           lons.append(lon)
+   return np.array(lats), np.array(lons)
+
+@pytest.mark.parametrize("cell_degrees", [0.001, 0.01, 0.5])
+def test_classify_points_matches_box_loop(parts, cell_degrees):
+   regions = parts["AIRPORT_BOX_REGIONS"] | parts["NEW_YORK_BOX_REGIONS"]
+   rng = np.random.default_rng(11)
+   lats = np.concatenate([rng.uniform(40.5, 41.0, 20_000), edge_points(regions)[0], [np.nan]])
+   lons = np.concatenate([rng.uniform(-74.3, -73.6, 20_000), edge_points(regions)[1], [-73.8]])
+   region_index = parts["build_region_index"](regions, cell_degrees)
+
+   expected = classify_by_loop(lats, lons, regions)
+   assert parts["classify_points"](lats, lons, region_index).tolist() == expected
+   assert parts["points_in_region"](lats, lons, region_index, "NYC").tolist() == [
+       is_within_bbox((lat, lon), parts["NEW_YORK_BOX_COORDS"]) for lat, lon in zip(lats, lons)
+   ]
+
+def test_overlapping_regions_keep_priority(parts):
+   rng = np.random.default_rng(12)
+   regions = {}
+   for i in range(40):
+       lat_min, lon_min = rng.uniform(40.5, 40.9), rng.uniform(-74.2, -73.8)
+       regions[f"box{i}"] = ((lat_min, lon_min), (lat_min + rng.uniform(0.001, 0.2), lon_min + rng.uniform(0.001, 0.2)))
+   lats = np.concatenate([rng.uniform(40.4, 41.2, 20_000), edge_points(regions)[0]])
+   lons = np.concatenate([rng.uniform(-74.3, -73.5, 20_000), edge_points(regions)[1]])
+
+   labels = parts["classify_points"](lats, lons, parts["build_region_index"](regions), default=None)
+   assert labels.tolist() == classify_by_loop(lats, lons, regions)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+@pytest.fixture
+def distances() -> np.ndarray:
+   """Trip-distance-like values: log-normal, with zeros, a few negatives and NaNs."""
+   rng = np.random.default_rng(3)
+   values = rng.lognormal(0.8, 1.0, 20_000)
+   values[rng.random(len(values)) < 0.03] = 0.0
+   values[rng.random(len(values)) < 0.01] *= -1
+   values[rng.random(len(values)) < 0.01] = np.nan
+   return values
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_sketch_quantiles_within_relative_accuracy(parts, distances, relative_accuracy):
+   sketch = parts["build_quantile_sketch"](distances, relative_accuracy)
+   values = np.sort(distances[~np.isnan(distances)])
+
+   assert sketch["count"] == len(values)
+   for q in [0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1]:
+       exact = values[int(np.ceil(q * (len(values) - 1)))]
+       estimate = parts["sketch_quantile"](sketch, q)
+       assert abs(estimate - exact) <= relative_accuracy * abs(exact) * (1 + 1e-9)
+
+def test_merged_sketches_equal_one_sketch(parts, distances):
+   whole = parts["build_quantile_sketch"](distances)
+   merged = parts["merge_quantile_sketches"](
+       [parts["build_quantile_sketch"](part) for part in np.array_split(distances, 7)]
+   )
+
+   assert merged == whole
+   assert parts["sketch_from_json"](parts["_sketch_to_json"](merged)) == whole
+   for q in [0.05, 0.5, 0.95]:
+       assert parts["sketch_quantile"](merged, q) == parts["sketch_quantile"](whole, q)
+
+def test_sketches_of_different_accuracy_do_not_merge(parts, distances):
+   with pytest.raises(ValueError):
+       parts["merge_quantile_sketches"]([
+           parts["build_quantile_sketch"](distances, 0.01),
+           parts["build_quantile_sketch"](distances, 0.02)
+       ])
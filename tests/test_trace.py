@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+def test_trace_stage_records_stage_memory(parts):
+   with parts["trace_stage"]("outer"):
+       with parts["trace_stage"]("allocate") as span:
+           # The cast allocates 64 MiB from the Arrow pool; the numpy array is not copied
+           values = pa.array(np.arange(8 * 2**20, dtype=np.int64)).cast(pa.float64())
+           span["rows_out"] = len(values)
+       del values
+
+   trace = parts["read_trace"]().set_index("stage")
+   assert trace.loc["allocate", "arrow_delta_mb"] >= 63
+   assert trace.loc["allocate", "arrow_peak_mb"] >= 63
+   # The array is freed before the outer stage ends, but its peak still counts
+   assert abs(trace.loc["outer", "arrow_delta_mb"]) < 1
+   assert trace.loc["outer", "arrow_peak_mb"] >= 63
+   assert trace.loc["allocate", "peak_rss_mb"] >= trace.loc["allocate", "rss_start_mb"]
+
+   summary = parts["summarize_trace"]().set_index("stage")
+   assert summary.loc["allocate", "arrow_peak_mb"] >= 63
+
+def test_query_stage_records_cache_hit(parts):
+   def compute():
+       return pd.DataFrame({"rides": [1, 2, 3]})
+
+   for _ in range(2):
+       with parts["trace_stage"]("query", use_cache=True):
+           parts["cached_result"]("SELECT rides", 1, compute)
+   with parts["trace_stage"]("query", use_cache=False):
+       parts["cached_result"]("SELECT rides", 1, compute, use_cache=False)
+
+   assert parts["read_trace"]()["cache_hit"].tolist() == [False, True, False]
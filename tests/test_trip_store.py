@@ -0,0 +1,49 @@
+import glob
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_dataset
+
+@pytest.fixture
+def both_backends(parts, workdir, monkeypatch) -> dict:
+   """The same two synthetic months ingested into the SQLite trip tables and the Parquet trip store."""
+   dataset = generate_dataset(os.path.join(workdir, "source"), ["2024-01", "2024-02"], 2000)
+   monkeypatch.setitem(parts, "TAXI_ZONES_SHAPEFILE", dataset["taxi_zones"])
+   parts["ingest_weather_files"](dataset["weather"])
+   for table_name, service in (("taxi_trips", "taxi"), ("uber_trips", "uber")):
+       for backend in ("sqlite", "parquet"):
+           summary = parts["ingest_trip_months"](table_name, dataset[service], workers=1, backend=backend)
+           assert len(summary["ingested"]) == 2
+   return dataset
+
+def test_read_trip_store_prunes_months_and_columns(parts, both_backends):
+   # A month outside the range is never opened, so a broken file there is not noticed
+   for path in glob.glob(os.path.join(parts["TRIP_STORE_DIRECTORY"], "service=taxi", "year=2024", "month=2", "*")):
+       with open(path, "wb") as f:
+           f.write(b"not parquet")
+
+   trips = parts["read_trip_store"]("taxi", ["pickup_datetime", "trip_distance"], "2024-01-10", "2024-02-01")
+
+   assert list(trips.columns) == ["pickup_datetime", "trip_distance"]
+   pickups = pd.to_datetime(trips["pickup_datetime"])
+   assert (pickups >= "2024-01-10").all() and (pickups < "2024-02-01").all()
+   conn = sqlite3.connect("project.db")
+   try:
+       expected = conn.execute(
+           "SELECT COUNT(*) FROM taxi_trips WHERE pickup_date >= '2024-01-10' AND pickup_date < '2024-02-01'"
+       ).fetchone()[0]
+   finally:
+       conn.close()
+   assert 0 < len(trips) == expected
+
+def test_registered_queries_match_across_backends(parts, both_backends):
+   sqlite_results = parts["run_queries"](workers=1, use_cache=False, backend="sqlite")
+   parquet_results = parts["run_queries"](workers=1, use_cache=False, backend="parquet")
+
+   assert sqlite_results.keys() == parquet_results.keys() == parts["QUERY_REGISTRY"].keys()
+   for name, result in sqlite_results.items():
+       assert len(result) > 0, name
+       pd.testing.assert_frame_equal(result, parquet_results[name], obj=name)
@@ -0,0 +1,45 @@
+import os
+
+import pandas as pd
+
+from benchmarks.synthetic import write_weather_csv
+
+def test_clean_weather_file_rereads_changed_upstream_csv(parts, workdir):
+   site = os.path.join(workdir, "site")
+   os.makedirs(site)
+   source_path = write_weather_csv(os.path.join(site, "2024_weather.csv"), 2024, seed=1)
+   server, base_url = parts["serve_directory"](site)
+   url = base_url + "2024_weather.csv"
+   try:
+       first_hourly, _ = parts["clean_weather_file"](url)
+       pd.testing.assert_frame_equal(parts["clean_weather_file"](url)[0], first_hourly)
+
+       write_weather_csv(source_path, 2024, seed=2)
+       modified = os.path.getmtime(source_path) + 60
+       os.utime(source_path, (modified, modified))
+       second_hourly, second_daily = parts["clean_weather_file"](url)
+   finally:
+       server.shutdown()
+
+   assert not second_hourly.equals(first_hourly)
+   expected_hourly, expected_daily = parts["clean_weather_file"](source_path, refresh=True)
+   pd.testing.assert_frame_equal(second_hourly, expected_hourly)
+   pd.testing.assert_frame_equal(second_daily, expected_daily)
+   # Only the current CSV's cache is kept
+   assert len(os.listdir(parts["WEATHER_CACHE_DIR"])) == 2
+
+def test_weather_index_skips_missing_datetimes(parts, workdir):
+   epoch = parts["WEATHER_INDEX_EPOCH"]
+   datetimes = pd.Series([epoch, epoch + pd.Timedelta(minutes=90), pd.NaT, epoch - pd.Timedelta(hours=1)])
+   assert parts["hours_since_weather_epoch"](datetimes).tolist() == [0, 2, -1, -1]
+
+   hourly_weather = pd.DataFrame({
+       'date': pd.date_range(epoch, periods=3, freq='h'),
+       'hourly precipitation': [0.0, 0.1, 0.2],
+       'hourly temperature': [30.0, 31.0, 32.0],
+       'hourly windspeed': [5.0, 6.0, 7.0]
+   })
+   weather_index = parts["build_hourly_weather_index"](hourly_weather)
+   trips = parts["attach_hourly_weather"](pd.DataFrame({'pickup_datetime': datetimes}), weather_index)
+   assert trips['hourly temperature'].tolist()[:2] == [30.0, 32.0]
+   assert trips['hourly temperature'].iloc[2:].isna().all()